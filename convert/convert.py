@@ -1,76 +1,289 @@
 import re
 import sqlite3
+import time
 
 # File names
 input_filename = "mysql_dump.sql"  # replace with your file name
 output_filename = "sqlite.db"  # replace with desired SQLite DB name
 
-# Open MySQL dump file and SQLite3 DB
-with open(input_filename, "r") as f_input, sqlite3.connect(output_filename) as conn:
-    cursor = conn.cursor()
-
-    # A buffer for multi-line SQL commands
-    command_buffer = ""
-
-    # Loop through each line in the SQL file
-    for line in f_input:
-        # Skip comments, SET, LOCK and UNLOCK commands
-        if re.match(
-            r"(--.*)|(\/\*.*)|(SET.*)|(LOCK TABLES.*)|(UNLOCK TABLES.*)|(ALTER TABLE.*)",
-            line,
-        ):
-            continue
-
-        # Append line to the buffer
-        command_buffer += line
-
-        # If the line ends with a semicolon, it's the end of the command
-        if re.search(r";\s*$", line):
-            command_buffer = command_buffer.replace("),(", "),\n(")
-
-            # MySQL to SQLite replacements
-            command_buffer = re.sub(r"`", "", command_buffer)  # replace ` with nothing
-            command_buffer = re.sub(
-                r" AUTO_INCREMENT", "", command_buffer
-            )  # remove AUTO_INCREMENT
-            command_buffer = re.sub(r" unsigned", "", command_buffer)  # remove unsigned
-            command_buffer = re.sub(
-                r" int\([0-9]+\)", " INTEGER", command_buffer
-            )  # replace all int(X) with INTEGER
-            command_buffer = re.sub(
-                r" ENGINE=.*", "", command_buffer
-            )  # remove all after ENGINE=
-            command_buffer = re.sub(
-                r",\s+UNIQUE KEY .* \((.*)\)", r", UNIQUE(\1)", command_buffer
-            )  # replace UNIQUE KEY with comma before
-            command_buffer = re.sub(
-                r" UNIQUE KEY .* \((.*)\)", r" UNIQUE(\1)", command_buffer
-            )  # replace UNIQUE KEY without comma before
-
-            # Convert MySQL specific commands to SQLite
-            command_buffer = re.sub(r"IF NOT EXISTS", "", command_buffer)
-            command_buffer = re.sub(r"DEFAULT CHARSET=latin1", "", command_buffer)
-
-            # Handle backslash escaping for SQLite
-            command_buffer = command_buffer.replace("\\'", "''")
-            command_buffer = command_buffer.replace('\\"', '""')
-
-            # Fix :/ and /!\
-            command_buffer = command_buffer.replace(":\\''", ":\\'")
-            command_buffer = command_buffer.replace("/!\\''", "/:\\'")
-
-            # Execute each command (continue on error)
-            try:
-                cursor.execute(command_buffer)
-            except sqlite3.Error as e:
-                print(f"Error message: {e.args[0]}")
-                for i, line in enumerate(command_buffer.split("\n"), start=1):
-                    print(f"Line {i}: {line}")
-
-            # Clear the command buffer
-            command_buffer = ""
-
-    # Commit changes and close
-    conn.commit()
-
-print("MySQL to SQLite conversion complete!")
+# The dump is read this many characters at a time
+CHUNK_SIZE = 1 << 20
+
+# Rows are inserted with executemany this many at a time
+BATCH_SIZE = 10000
+
+# Progress is reported every this many rows
+PROGRESS_EVERY = 100000
+
+# Skip comments, SET, LOCK and UNLOCK commands
+SKIPPED_LINE = re.compile(
+    r"(--.*)|(\/\*.*)|(SET.*)|(LOCK TABLES.*)|(UNLOCK TABLES.*)|(ALTER TABLE.*)"
+)
+
+INSERT_HEADER = re.compile(r"INSERT INTO `?(\w+)`?\s*(?:\([^)]*\)\s*)?VALUES\s*")
+
+# A parenthesised row of values, with quotes and parentheses inside strings
+QUOTED = r"'[^'\\]*(?:\\.[^'\\]*)*'"
+ROW = re.compile(rf"\((?:[^'()]|{QUOTED})*\)", re.DOTALL)
+VALUE = re.compile(rf"{QUOTED}|[^,\s']+", re.DOTALL)
+
+STATEMENT_END = re.compile(r";\s*$")
+
+ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+ESCAPES = {
+    "0": "\0",
+    "b": "\b",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "Z": "\x1a",
+    "%": "\\%",
+    "_": "\\_",
+}
+
+# MySQL to SQLite replacements, only needed for schema statements
+DDL_REWRITES = [
+    (re.compile(pattern), replacement)
+    for pattern, replacement in [
+        (r"`", ""),  # replace ` with nothing
+        (r" AUTO_INCREMENT", ""),  # remove AUTO_INCREMENT
+        (r" unsigned", ""),  # remove unsigned
+        (r" int\([0-9]+\)", " INTEGER"),  # replace all int(X) with INTEGER
+        (r" ENGINE=.*", ""),  # remove all after ENGINE=
+        (
+            r",\s+UNIQUE KEY .* \((.*)\)",
+            r", UNIQUE(\1)",
+        ),  # replace UNIQUE KEY with comma before
+        (
+            r" UNIQUE KEY .* \((.*)\)",
+            r" UNIQUE(\1)",
+        ),  # replace UNIQUE KEY without comma before
+        # Convert MySQL specific commands to SQLite
+        (r"IF NOT EXISTS", ""),
+        (r"DEFAULT CHARSET=latin1", ""),
+        # Handle backslash escaping for SQLite
+        (r"\\'", "''"),
+    ]
+]
+
+
+def parse_value(token):
+    if token.startswith("'"):
+        return ESCAPE.sub(lambda m: ESCAPES.get(m[1], m[1]), token[1:-1])
+
+    if token == "NULL":
+        return None
+
+    for number in (int, float):
+        try:
+            return number(token)
+        except ValueError:
+            pass
+
+    return token
+
+
+def parse_row(row):
+    return tuple(parse_value(m[0]) for m in VALUE.finditer(row, 1, len(row) - 1))
+
+
+class DumpReader:
+    """
+    Reads a MySQL dump incrementally, yielding ("sql", statement) for schema
+    statements and ("rows", table, rows) for the values of INSERT statements,
+    without ever holding a whole INSERT in memory.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.statements = 0
+
+    def fill(self):
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while self.pos >= len(self.buffer):
+            if not self.fill():
+                return ""
+        return self.buffer[self.pos]
+
+    def ensure(self, length):
+        # Read until length characters past pos are buffered, or the dump ends
+        while len(self.buffer) - self.pos < length and self.fill():
+            pass
+
+    def skip_whitespace(self):
+        while self.peek().isspace():
+            self.pos += 1
+
+    def match(self, regex):
+        # Only trust a match that stops short of the end of the buffer
+        while True:
+            m = regex.match(self.buffer, self.pos)
+            if m and m.end() < len(self.buffer) or self.eof:
+                return m
+            self.fill()
+
+    def read_line(self):
+        lines = []
+        while True:
+            end = self.buffer.find("\n", self.pos)
+            if end != -1:
+                lines.append(self.buffer[self.pos : end + 1])
+                self.pos = end + 1
+                return "".join(lines)
+
+            lines.append(self.buffer[self.pos :])
+            self.pos = len(self.buffer)
+            if not self.fill():
+                return "".join(lines)
+
+    def read_rows(self, table):
+        rows = []
+        while True:
+            self.skip_whitespace()
+            char = self.peek()
+
+            if char == "(":
+                m = self.match(ROW)
+                if m is None:
+                    raise ValueError(f"Unterminated row in INSERT INTO {table}")
+                rows.append(parse_row(m[0]))
+                self.pos = m.end()
+
+                if len(rows) >= BATCH_SIZE:
+                    yield ("rows", table, rows)
+                    rows = []
+            elif char == ",":
+                self.pos += 1
+            else:
+                if char == ";":
+                    self.pos += 1
+                break
+
+        if rows:
+            yield ("rows", table, rows)
+
+    def __iter__(self):
+        command_buffer = []
+
+        while True:
+            if not command_buffer:
+                self.skip_whitespace()
+                if not self.peek():
+                    return
+
+                self.ensure(len("INSERT INTO"))
+                if self.buffer.startswith("INSERT INTO", self.pos):
+                    m = self.match(INSERT_HEADER)
+                    self.pos = m.end()
+                    self.statements += 1
+                    yield from self.read_rows(m[1])
+                    continue
+
+            line = self.read_line()
+            if not line:
+                return
+
+            if SKIPPED_LINE.match(line):
+                continue
+
+            # Append line to the buffer
+            command_buffer.append(line)
+
+            # If the line ends with a semicolon, it's the end of the command
+            if STATEMENT_END.search(line):
+                self.statements += 1
+                yield ("sql", "".join(command_buffer))
+                command_buffer = []
+
+
+def rewrite_ddl(statement):
+    for pattern, replacement in DDL_REWRITES:
+        statement = pattern.sub(replacement, statement)
+    return statement
+
+
+def insert_rows(cursor, table, rows):
+    placeholders = ", ".join("?" * len(rows[0]))
+    sql = f"INSERT INTO {table} VALUES ({placeholders})"
+
+    while rows:
+        consumed = 0
+
+        def counted():
+            nonlocal consumed
+            for row in rows:
+                consumed += 1
+                yield row
+
+        try:
+            cursor.executemany(sql, counted())
+            return
+        except sqlite3.Error as e:
+            # Rows before the failing one are kept, carry on after it
+            print(f"Error message: {e.args[0]}")
+            print(f"Row {rows[consumed - 1][:3]}... in {table}")
+            rows = rows[consumed:]
+
+
+def report(reader, rows, started):
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(
+        f"{reader.statements} statements, {rows} rows in {elapsed:.1f}s "
+        f"({reader.statements / elapsed:.0f} statements/s, {rows / elapsed:.0f} rows/s)"
+    )
+
+
+def main():
+    # Open MySQL dump file and SQLite3 DB
+    with open(input_filename, "r") as f_input, sqlite3.connect(output_filename) as conn:
+        # Nothing needs to survive a crash halfway through a conversion
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        cursor = conn.cursor()
+
+        reader = DumpReader(f_input)
+        rows = 0
+        next_report = PROGRESS_EVERY
+        started = time.monotonic()
+
+        for event in reader:
+            if event[0] == "sql":
+                # Execute each command (continue on error)
+                command = rewrite_ddl(event[1])
+                try:
+                    cursor.execute(command)
+                except sqlite3.Error as e:
+                    print(f"Error message: {e.args[0]}")
+                    for i, line in enumerate(command.split("\n"), start=1):
+                        print(f"Line {i}: {line}")
+                continue
+
+            _, table, batch = event
+            insert_rows(cursor, table, batch)
+            rows += len(batch)
+
+            if rows >= next_report:
+                report(reader, rows, started)
+                next_report += PROGRESS_EVERY
+
+        # Commit changes and close
+        conn.commit()
+        report(reader, rows, started)
+
+    print("MySQL to SQLite conversion complete!")
+
+
+if __name__ == "__main__":
+    main()
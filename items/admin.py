@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 
+from .counts import mark_stale
 from .models import Item, Version, Download, Review, Screenshot, Tag
 
 
@@ -27,6 +28,10 @@ class VersionAdmin(admin.ModelAdmin):
 class DownloadAdmin(admin.ModelAdmin):
     list_display = ["user", "version", "created_at", "updated_at"]
 
+    def delete_queryset(self, request, queryset):
+        mark_stale("version", queryset.values_list("version", flat=True))
+        super().delete_queryset(request, queryset)
+
 
 class ReviewAdmin(admin.ModelAdmin):
     ordering = ["-created_at"]
@@ -0,0 +1,52 @@
+import zlib
+
+from django.db import connection, transaction
+
+from .models import Change, Item, Review, Screenshot, Version
+
+# Models whose edits are logged, under the names clients see
+TRACKED_MODELS = {
+    "item": Item,
+    "version": Version,
+    "screenshot": Screenshot,
+    "review": Review,
+}
+
+
+# Key of the PostgreSQL advisory lock held while changes are logged. Every
+# advisory lock in the database shares one key space, so the key is derived
+# from the change table's name rather than picked by hand.
+CHANGE_LOG_LOCK = zlib.crc32(Change._meta.db_table.encode())
+
+
+def insert_changes(model, object_ids, action):
+    # Ids come from a sequence, so two concurrent inserts could commit in the
+    # opposite order to their ids, and a client that has already read the
+    # higher one would skip the other for good. Holding the lock until commit
+    # makes each insert wait for the last to be visible.
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CHANGE_LOG_LOCK])
+        Change.objects.bulk_create(
+            [
+                Change(model=model, object_id=object_id, action=action)
+                for object_id in sorted(object_ids)
+            ]
+        )
+
+
+def record_changes(Model, object_ids, action):
+    """
+    Logs a change to each of object_ids once the surrounding transaction
+    commits, so rolled back edits are never logged. For writes that skip
+    the save and delete signals, like QuerySet.update().
+    """
+    model = Model._meta.model_name
+    object_ids = set(object_ids)
+    if object_ids:
+        transaction.on_commit(lambda: insert_changes(model, object_ids, action))
+
+
+def record_change(instance, action):
+    record_changes(type(instance), [instance.pk], action)
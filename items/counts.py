@@ -0,0 +1,147 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import (
+    Avg,
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+)
+from django.db.models.functions import Coalesce
+
+from .models import (
+    Item,
+    Download,
+    Review,
+    Screenshot,
+    StaleCount,
+    Version,
+    Tag,
+    User,
+)
+
+
+def mark_stale(label, ids):
+    """Queues rows whose counts recalculate_counts --incremental should repair."""
+    StaleCount.objects.bulk_create(
+        StaleCount(model=label, object_id=pk) for pk in set(ids) if pk is not None
+    )
+
+
+def count_subquery(queryset, group_by):
+    return Coalesce(
+        Subquery(
+            queryset.values(group_by).annotate(c=Count("id")).values("c"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def annotate_version_counts(versions):
+    return versions.annotate(
+        new_downloads_count=count_subquery(
+            Download.objects.filter(version=OuterRef("pk")), "version"
+        ),
+    )
+
+
+def annotate_tag_counts(tags):
+    return tags.annotate(
+        new_count=count_subquery(
+            Item.tags.through.objects.filter(tag=OuterRef("pk")), "tag"
+        ),
+    )
+
+
+def annotate_item_counts(items):
+    return items.annotate(
+        new_downloads_count=count_subquery(
+            Download.objects.filter(version__item=OuterRef("pk")), "version__item"
+        ),
+        new_reviews_count=count_subquery(
+            Review.objects.filter(version__item=OuterRef("pk")), "version__item"
+        ),
+        new_screenshots_count=count_subquery(
+            Screenshot.objects.filter(item=OuterRef("pk")), "item"
+        ),
+        new_rating_average=Coalesce(
+            Subquery(
+                Review.objects.filter(version__item=OuterRef("pk"))
+                .values("version__item")
+                .annotate(avg=Avg("rating"))
+                .values("avg"),
+                output_field=FloatField(),
+            ),
+            0.0,
+        ),
+        new_version_created_at=Subquery(
+            Version.objects.filter(item=OuterRef("pk"))
+            .values("item")
+            .annotate(latest=Max("created_at"))
+            .values("latest"),
+        ),
+    ).annotate(
+        new_rating_weighted=ExpressionWrapper(
+            F("new_rating_average")
+            + (F("new_rating_average") - 2.5) * (F("new_reviews_count") / 10.0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def annotate_user_counts(users):
+    return users.annotate(
+        new_items_count=count_subquery(
+            Item.objects.filter(user=OuterRef("pk")), "user"
+        ),
+        new_reviews_count=count_subquery(
+            Review.objects.filter(user=OuterRef("pk")), "user"
+        ),
+    )
+
+
+# Stored counter fields per model, each checked against the "new_" annotation
+# added by the matching annotate function above.
+COUNTED_MODELS = {
+    "version": (Version, annotate_version_counts, ["downloads_count"]),
+    "tag": (Tag, annotate_tag_counts, ["count"]),
+    "item": (
+        Item,
+        annotate_item_counts,
+        [
+            "downloads_count",
+            "reviews_count",
+            "screenshots_count",
+            "rating_average",
+            "rating_weighted",
+            "version_created_at",
+        ],
+    ),
+    "user": (User, annotate_user_counts, ["items_count", "reviews_count"]),
+}
+
+
+def differs(field):
+    # NULL-safe inequality between a stored field and its "new_" annotation
+    computed = f"new_{field}"
+    stored_null = Q(**{f"{field}__isnull": True})
+    computed_null = Q(**{f"{computed}__isnull": True})
+    return (
+        (stored_null & ~computed_null)
+        | (~stored_null & computed_null)
+        | (~stored_null & ~computed_null & ~Q(**{field: F(computed)}))
+    )
+
+
+def drifted(queryset, annotate_counts, fields):
+    # Rows of queryset where any stored counter in fields disagrees with its source
+    return annotate_counts(queryset.order_by()).filter(
+        reduce(or_, (differs(field) for field in fields))
+    )
@@ -0,0 +1,56 @@
+import zlib
+
+import orjson
+from django.db.models import Prefetch
+
+from .models import Item, Version
+from .serializers import ItemSerializer, ReviewSerializer, VersionSerializer
+
+# Items fetched, and their related rows prefetched, per round trip
+EXPORT_CHUNK_SIZE = 500
+
+
+def export_item(item):
+    data = ItemSerializer(item, expand=["tags", "screenshots"]).data
+    data["versions"] = [
+        {
+            **VersionSerializer(version).data,
+            "reviews": ReviewSerializer(version.reviews.all(), many=True).data,
+        }
+        for version in item.versions.all()
+    ]
+    return data
+
+
+def export_lines(after_id=0):
+    """
+    Yields every item after after_id as a line of JSON, in id order, with its
+    tags, screenshots, versions and their reviews. Items are read through a
+    server-side cursor a chunk at a time, so memory use stays flat.
+    """
+    items = (
+        Item.objects.filter(pk__gt=after_id)
+        .order_by("pk")
+        .prefetch_related(
+            "tags",
+            "screenshots",
+            Prefetch(
+                "versions",
+                queryset=Version.objects.order_by("created_at").prefetch_related(
+                    "reviews"
+                ),
+            ),
+        )
+    )
+
+    for item in items.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield orjson.dumps(export_item(item)) + b"\n"
+
+
+def gzip_lines(lines):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for line in lines:
+        chunk = compressor.compress(line)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
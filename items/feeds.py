@@ -1,36 +1,194 @@
+import hashlib
+import time
+
 from django.conf import settings
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 from django.urls import path
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date, quote_etag
 from markdownify.templatetags.markdownify import markdownify
 
-from items.models import Review, Version
+from items.models import Item, Review, Tag, User, Version
 from items.utils import get_filtered_items, PAGE_SIZE
 
 
-class ItemsFeed(Feed):
+FEED_GENERATION_KEY = "feed_generation"
+
+# Feeds only go stale through clear_feeds; this just lets documents rendered
+# for an old generation drop out of the cache
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_feed_generation():
+    # Kept until clear_feeds, so feeds are rebuilt only when something changed
+    return cache.get_or_set(FEED_GENERATION_KEY, time.time_ns, None)
+
+
+def clear_feeds():
+    # Cached feeds are keyed by generation, so a new one orphans all of them
+    cache.delete(FEED_GENERATION_KEY)
+
+
+class CachedFeed(Feed):
+    """
+    Serves the rendered feed document from the cache, rebuilding it only
+    after clear_feeds, and answers conditional requests with a 304.
+    """
+
+    def __call__(self, request, *args, **kwargs):
+        key = f"feed:{get_feed_generation()}:{request.path}"
+        cached = cache.get(key)
+
+        if cached is None:
+            response = super().__call__(request, *args, **kwargs)
+            cached = {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+                "last_modified": response.get("Last-Modified"),
+            }
+            cache.set(key, cached, FEED_CACHE_TIMEOUT)
+
+        response = HttpResponse(cached["content"], content_type=cached["content_type"])
+        response["ETag"] = cached["etag"]
+        last_modified = None
+        if cached["last_modified"]:
+            response["Last-Modified"] = cached["last_modified"]
+            last_modified = parse_http_date(cached["last_modified"])
+
+        return get_conditional_response(
+            request,
+            etag=cached["etag"],
+            last_modified=last_modified,
+            response=response,
+        )
+
+
+# Entries are keyed by what they are rendered from, so edits never need clearing
+FEED_ENTRY_TIMEOUT = 60 * 60 * 24
+
+
+def entry_key(version):
+    return (
+        f"feed_entry:{version.pk}:{version.updated_at.timestamp()}"
+        f":{version.item.updated_at.timestamp()}"
+    )
+
+
+def render_entry(version):
+    return {
+        "guid": f"https://{settings.FEED_HOST}/items/{version.item.permalink}/versions/{version.id}/",
+        "link": f"https://{settings.FEED_HOST}/items/{version.item.permalink}/",
+        "title": version.item.name,
+        "description": markdownify(version.item.body),
+        "pubdate": version.created_at,
+    }
+
+
+def get_feed_entries(versions):
+    """
+    Returns the rendered entries for versions, in order. Entries are shared by
+    every feed they appear in, so only versions no feed has shown yet are
+    rendered.
+    """
+    keys = [entry_key(version) for version in versions]
+    entries = cache.get_many(keys)
+
+    missing = {
+        key: render_entry(version)
+        for key, version in zip(keys, versions)
+        if key not in entries
+    }
+    if missing:
+        cache.set_many(missing, FEED_ENTRY_TIMEOUT)
+        entries.update(missing)
+
+    return [entries[key] for key in keys]
+
+
+class ItemsFeed(CachedFeed):
     title = f"{settings.SITE_TITLE} Downloads"
     link = f"https://{settings.FEED_HOST}"
     description = f"Latest updates and submissions to {settings.SITE_TITLE}."
 
-    def items(self):
-        return Version.objects.order_by("-created_at").prefetch_related("item")[
-            :PAGE_SIZE
-        ]
+    def versions(self, obj):
+        return Version.objects.all()
 
-    def item_guid(self, obj):
-        return f"https://{settings.FEED_HOST}/items/{obj.item.permalink}/versions/{obj.id}/"
+    def items(self, obj):
+        versions = self.versions(obj).order_by("-created_at").select_related("item")
+        return get_feed_entries(versions[:PAGE_SIZE])
+
+    def item_guid(self, entry):
+        return entry["guid"]
+
+    def item_link(self, entry):
+        return entry["link"]
+
+    def item_title(self, entry):
+        return entry["title"]
+
+    def item_description(self, entry):
+        return entry["description"]
+
+    def item_pubdate(self, entry):
+        return entry["pubdate"]
+
+
+class TagFeed(ItemsFeed):
+    def get_object(self, request, name):
+        return get_object_or_404(Tag, name=name)
+
+    def title(self, tag):
+        return f"{settings.SITE_TITLE} Downloads tagged {tag.name}"
+
+    def link(self, tag):
+        return f"https://{settings.FEED_HOST}/tags/{tag.name}/"
+
+    def description(self, tag):
+        return f"Latest updates and submissions tagged {tag.name} on {settings.SITE_TITLE}."
+
+    def versions(self, tag):
+        return Version.objects.filter(item__tags=tag)
 
-    def item_link(self, version):
-        return f"https://{settings.FEED_HOST}/items/{version.item.permalink}/"
 
-    def item_title(self, version):
-        return version.item.name
+class ScenarioFeed(ItemsFeed):
+    def get_object(self, request, item_permalink):
+        return get_object_or_404(Item, permalink=item_permalink)
 
-    def item_description(self, version):
-        return markdownify(version.item.body)
+    def title(self, scenario):
+        return f"{settings.SITE_TITLE} Downloads for {scenario.name}"
 
+    def link(self, scenario):
+        return f"https://{settings.FEED_HOST}/scenarios/{scenario.permalink}/"
 
-class ReviewsFeed(Feed):
+    def description(self, scenario):
+        return f"Latest updates and submissions for {scenario.name} on {settings.SITE_TITLE}."
+
+    def versions(self, scenario):
+        return Version.objects.filter(item__tc=scenario)
+
+
+class UserFeed(ItemsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, user):
+        return f"{settings.SITE_TITLE} Downloads by {user.first_name}"
+
+    def link(self, user):
+        return f"https://{settings.FEED_HOST}/users/{user.username}/"
+
+    def description(self, user):
+        return f"Latest updates and submissions by {user.first_name} on {settings.SITE_TITLE}."
+
+    def versions(self, user):
+        return Version.objects.filter(item__user=user)
+
+
+class ReviewsFeed(CachedFeed):
     title = f"{settings.SITE_TITLE} Reviews"
     link = f"https://{settings.FEED_HOST}/reviews/"
     description = f"Latest reviews on {settings.SITE_TITLE}."
@@ -38,7 +196,9 @@ class ReviewsFeed(Feed):
     item_guid_is_permalink = False
 
     def items(self):
-        return Review.objects.order_by("-created_at")[:PAGE_SIZE]
+        return Review.objects.order_by("-created_at").select_related("version__item")[
+            :PAGE_SIZE
+        ]
 
     def item_guid(self, obj):
         return f"https://{settings.FEED_HOST}/items/{obj.version.item.permalink}/reviews/{obj.id}"
@@ -49,8 +209,14 @@ class ReviewsFeed(Feed):
     def item_description(self, item):
         return markdownify(item.body)
 
+    def item_pubdate(self, item):
+        return item.created_at
+
 
 feed_paths = [
     path("items.rss", ItemsFeed()),
     path("reviews.rss", ReviewsFeed()),
+    path("tags/<str:name>.rss", TagFeed()),
+    path("scenarios/<str:item_permalink>.rss", ScenarioFeed()),
+    path("users/<str:username>.rss", UserFeed()),
 ]
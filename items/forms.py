@@ -4,11 +4,12 @@ from django import forms
 from django.conf import settings as conf_settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import BaseUserCreationForm
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
-from django.db.models import Count
 
 from items.models import Item, Version, Screenshot, Review, Tag
+from items.tags import set_item_tags
 
 User = get_user_model()
 
@@ -65,6 +66,46 @@ class UserForm(BaseUserCreationForm):
         return user
 
 
+ITEM_FORM_CHOICES_KEY = "item_form_choices"
+
+# Item, tag and tagging changes clear the choices; the timeout catches
+# changes that skip signals, like queryset updates
+ITEM_FORM_CHOICES_TIMEOUT = 60 * 10
+
+
+def get_item_form_choices():
+    def build():
+        scenario_pks = dict(
+            Item.objects.filter(
+                permalink__in=conf_settings.SCENARIOS.values()
+            ).values_list("permalink", "pk")
+        )
+
+        return {
+            "scenarios": [
+                (scenario_pks[permalink], name)
+                for name, permalink in conf_settings.SCENARIOS.items()
+                if permalink in scenario_pks
+            ],
+            "popular_tags": list(
+                Tag.objects.filter(name__in=conf_settings.POPULAR_TAG_NAMES)
+                .order_by("-count")
+                .values_list("pk", "name")
+            ),
+            "tcs": list(
+                Item.objects.filter(tags__name="scenario")
+                .order_by("-version_created_at")
+                .values_list("pk", "name")
+            ),
+        }
+
+    return cache.get_or_set(ITEM_FORM_CHOICES_KEY, build, ITEM_FORM_CHOICES_TIMEOUT)
+
+
+def clear_item_form_choices():
+    cache.delete(ITEM_FORM_CHOICES_KEY)
+
+
 class ItemForm(forms.ModelForm):
     popular_tags = forms.ModelMultipleChoiceField(
         queryset=Tag.objects.filter(name__in=conf_settings.POPULAR_TAG_NAMES).order_by(
@@ -109,28 +150,23 @@ class ItemForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(ItemForm, self).__init__(*args, **kwargs)
 
-        tcs = [
-            (Item.objects.get(permalink=v).pk, k)
-            for k, v in conf_settings.SCENARIOS.items()
+        choices = get_item_form_choices()
+        self.fields["tc_radio_choice"].choices = choices["scenarios"]
+        self.fields["popular_tags"].choices = choices["popular_tags"]
+        self.fields["tc"].queryset = Item.objects.filter(tags__name="scenario")
+        self.fields["tc"].choices = [("", self.fields["tc"].empty_label)] + choices[
+            "tcs"
         ]
-        self.fields["tc_radio_choice"].choices = tcs
-
-        try:
-            scenario_tag = Tag.objects.get(name="scenario")
-            self.fields["tc"].queryset = Item.objects.filter(tags=scenario_tag)
-        except Tag.DoesNotExist:
-            print("Scenario tag not found. Skipping tc field.")
-            pass
 
         if self.instance and self.instance.pk:
-            self.fields["popular_tags"].initial = self.instance.tags.filter(
-                name__in=conf_settings.POPULAR_TAG_NAMES
-            )
+            tags = list(self.instance.tags.all())
+            self.fields["popular_tags"].initial = [
+                tag.pk for tag in tags if tag.name in conf_settings.POPULAR_TAG_NAMES
+            ]
             self.fields["additional_tags"].initial = ", ".join(
                 tag.name
-                for tag in self.instance.tags.exclude(
-                    name__in=conf_settings.POPULAR_TAG_NAMES
-                )
+                for tag in tags
+                if tag.name not in conf_settings.POPULAR_TAG_NAMES
             )
 
     def clean_additional_tags(self):
@@ -139,46 +175,20 @@ class ItemForm(forms.ModelForm):
         tag_list = re.findall(r"[\w-]+", data)
         return tag_list
 
-    from django.db.models import Count
-
     def save(self, commit=True):
         instance = super().save(commit=False)
 
         if instance.tc is None and self.cleaned_data["tc_radio_choice"]:
-            instance.tc = Item.objects.get(pk=self.cleaned_data["tc_radio_choice"])
-
-        instance.save()
-
-        # Get the current tags before clearing them
-        previous_tags = set(instance.tags.values_list("pk", flat=True))
-
-        # Clear all existing tags before adding new ones.
-        instance.tags.clear()
-
-        # add popular tags
-        for tag in self.cleaned_data["popular_tags"]:
-            instance.tags.add(tag)
-
-        # create and add additional tags
-        for tag_name in self.cleaned_data["additional_tags"]:
-            tag, created = Tag.objects.get_or_create(name=tag_name)
-            instance.tags.add(tag)
-
-        # Update all_tags set with the new tags
-        all_tags = previous_tags
-        all_tags.update(set(instance.tags.values_list("pk", flat=True)))
+            instance.tc_id = int(self.cleaned_data["tc_radio_choice"])
 
         instance.save()
 
-        # Update the count for all affected tags
-        tags = (
-            Tag.objects.filter(pk__in=all_tags)
-            .annotate(c=Count("item"))
-            .values("pk", "c")
+        set_item_tags(
+            instance,
+            self.cleaned_data["popular_tags"],
+            self.cleaned_data["additional_tags"],
         )
-
-        for tag in tags:
-            Tag.objects.filter(pk=tag["pk"]).update(count=tag["c"])
+        clear_item_form_choices()
 
         return instance
 
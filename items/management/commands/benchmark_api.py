@@ -0,0 +1,84 @@
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+
+from items.views.api import DownloadViewSet, ReviewViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the values() list path of the API against the serializer path "
+        "and check that both return the same output"
+    )
+
+    viewsets = {
+        "downloads": DownloadViewSet,
+        "reviews": ReviewViewSet,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=settings.API_MAX_PAGE_SIZE,
+            help="Rows per page",
+        )
+        parser.add_argument(
+            "--pages", type=int, default=3, help="Pages compared per endpoint"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Timed runs per page and path"
+        )
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        mismatches = []
+
+        for name, viewset in self.viewsets.items():
+            views = {
+                enabled: viewset.as_view(
+                    {"get": "list"}, values_list_enabled=enabled, throttle_classes=[]
+                )
+                for enabled in (False, True)
+            }
+            timings = {False: 0.0, True: 0.0}
+            url = f"/api/{name}/?page_size={options['page_size']}"
+
+            for page in range(options["pages"]):
+                contents = {}
+                for enabled, view in views.items():
+                    best = None
+                    for _ in range(options["repeat"]):
+                        request = factory.get(url, HTTP_HOST=settings.FEED_HOST)
+                        started = time.perf_counter()
+                        response = view(request)
+                        response.render()
+                        elapsed = time.perf_counter() - started
+                        best = elapsed if best is None else min(best, elapsed)
+
+                    timings[enabled] += best
+                    contents[enabled] = json.loads(response.content)
+
+                if contents[False] != contents[True]:
+                    mismatches.append(f"{name} page {page + 1}")
+
+                next_url = contents[False]["next"]
+                if not next_url:
+                    break
+                parts = urlsplit(next_url)
+                url = f"{parts.path}?{parts.query}"
+
+            self.stdout.write(
+                f"{name}: serializers {timings[False] * 1000:.1f} ms, "
+                f"values {timings[True] * 1000:.1f} ms "
+                f"({timings[False] / max(timings[True], 1e-9):.1f}x faster)"
+            )
+
+        if mismatches:
+            raise CommandError(f"Output differs on {', '.join(mismatches)}")
+
+        self.stdout.write(self.style.SUCCESS("Output matches on every page"))
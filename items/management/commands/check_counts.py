@@ -1,161 +1,60 @@
-from django.core.management.base import BaseCommand
-from django.db.models import (
-    Count,
-    Subquery,
-    OuterRef,
-    IntegerField,
-    FloatField,
-    Avg,
-    ExpressionWrapper,
-    F,
-    Max,
-    Q,
-)
-from django.db.models.functions import Coalesce
+import csv
+import json
 
-from items.models import Item, Download, Review, Screenshot, Version, Tag
-from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
 
-
-User = get_user_model()
+from items.counts import COUNTED_MODELS, drifted
 
 
 class Command(BaseCommand):
     help = "Check if download, review, screenshot, tag and user counts for each item are accurate"
 
-    def handle(self, *args, **options):
-        versions = Version.objects.all().annotate(
-            new_downloads_count=Coalesce(
-                Subquery(
-                    Download.objects.filter(version=OuterRef("pk"))
-                    .values("version")
-                    .annotate(c=Count("id"))
-                    .values("c"),
-                    output_field=IntegerField(),
-                ),
-                0,
-            ),
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=["text", "json", "csv"],
+            default="text",
+            help="text lists every mismatch, json and csv report mismatches per field",
         )
 
-        for version in versions:
-            if version.new_downloads_count != version.downloads_count:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f"Version ID {version.pk} download count is incorrect. Calculated: {version.new_downloads_count}, Current: {version.downloads_count}"
-                    )
-                )
-
-        # Check tag counts
-        tags = (
-            Item.tags.through.objects.all()
-            .values("tag")
-            .annotate(c=Count("item"))
-            .values("tag", "c")
-        )
+    def handle(self, *args, **options):
+        report = {}
 
-        for tag in tags:
-            current_tag = Tag.objects.get(id=tag["tag"])
-            if current_tag.count != tag["c"]:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f"Tag ID {current_tag.id} count is incorrect. Calculated: {tag['c']}, Current: {current_tag.count}"
-                    )
-                )
+        for label, (Model, annotate_counts, fields) in COUNTED_MODELS.items():
+            report[label] = dict.fromkeys(fields, 0)
 
-        items = (
-            Item.objects.all()
-            .annotate(
-                new_downloads_count=Coalesce(
-                    Subquery(
-                        Download.objects.filter(version__item=OuterRef("pk"))
-                        .values("version__item")
-                        .annotate(c=Count("id"))
-                        .values("c"),
-                        output_field=IntegerField(),
-                    ),
-                    0,
-                ),
-                new_reviews_count=Coalesce(
-                    Subquery(
-                        Review.objects.filter(version__item=OuterRef("pk"))
-                        .values("version__item")
-                        .annotate(c=Count("id"))
-                        .values("c"),
-                        output_field=IntegerField(),
-                    ),
-                    0,
-                ),
-                new_screenshots_count=Coalesce(
-                    Subquery(
-                        Screenshot.objects.filter(item=OuterRef("pk"))
-                        .values("item")
-                        .annotate(c=Count("id"))
-                        .values("c"),
-                        output_field=IntegerField(),
-                    ),
-                    0,
-                ),
-                new_rating_average=Coalesce(
-                    Subquery(
-                        Review.objects.filter(version__item=OuterRef("pk"))
-                        .values("version__item")
-                        .annotate(avg=Avg("rating"))
-                        .values("avg"),
-                        output_field=FloatField(),
-                    ),
-                    0.0,
-                ),
-            )
-            .annotate(
-                new_rating_weighted=ExpressionWrapper(
-                    F("new_rating_average")
-                    + (F("new_rating_average") - 2.5) * (F("new_reviews_count") / 10.0),
-                    output_field=FloatField(),
-                ),
-                new_version_created_at=Coalesce(Max("versions__created_at"), None),
+            # Only rows that have drifted leave the database
+            rows = drifted(Model.objects.all(), annotate_counts, fields).values(
+                "pk", *fields, *(f"new_{field}" for field in fields)
             )
-        )
-
-        for item in items:
-            checks = {
-                "downloads_count": item.new_downloads_count,
-                "reviews_count": item.new_reviews_count,
-                "screenshots_count": item.new_screenshots_count,
-                "rating_average": item.new_rating_average,
-                "rating_weighted": item.new_rating_weighted,
-                "version_created_at": item.new_version_created_at,
-            }
-
-            for field, new_value in checks.items():
-                if new_value != getattr(item, field):
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"Item ID {item.pk} {field} is incorrect. Calculated: {new_value}, Current: {getattr(item, field)}"
-                        )
-                    )
 
-        # Check User items and reviews counts
-        users = (
-            User.objects.all()
-            .annotate(
-                new_items_count=Count("items", distinct=True),
-                new_reviews_count=Count("reviews", distinct=True),
-            )
-            .filter(Q(new_items_count__gt=0) | Q(new_reviews_count__gt=0))
-        )
+            for row in rows.iterator(chunk_size=2000):
+                for field in fields:
+                    new_value = row[f"new_{field}"]
+                    if new_value == row[field]:
+                        continue
 
-        for user in users:
-            checks = {
-                "items_count": user.new_items_count,
-                "reviews_count": user.new_reviews_count,
-            }
+                    report[label][field] += 1
 
-            for field, new_value in checks.items():
-                if new_value != getattr(user, field):
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"User ID {user.pk} {field} is incorrect. Calculated: {new_value}, Current: {getattr(user, field)}"
+                    if options["format"] == "text":
+                        self.stdout.write(
+                            self.style.ERROR(
+                                f"{label.capitalize()} ID {row['pk']} {field} is incorrect. Calculated: {new_value}, Current: {row[field]}"
+                            )
                         )
-                    )
 
-        self.stdout.write(self.style.SUCCESS("Finished checking counts"))
+        total = sum(sum(fields.values()) for fields in report.values())
+
+        if options["format"] == "json":
+            self.stdout.write(json.dumps({"mismatches": report, "total": total}))
+        elif options["format"] == "csv":
+            writer = csv.writer(self.stdout, lineterminator="\n")
+            writer.writerow(["model", "field", "mismatches"])
+            for label, fields in report.items():
+                for field, count in fields.items():
+                    writer.writerow([label, field, count])
+        else:
+            self.stdout.write(self.style.SUCCESS("Finished checking counts"))
+
+        if total:
+            raise CommandError(f"Found {total} incorrect counts")
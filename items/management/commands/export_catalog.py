@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from items.export import export_lines, gzip_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Export every item with its tags, screenshots, versions and reviews as NDJSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", help="File to write to instead of standard output"
+        )
+        parser.add_argument(
+            "--after",
+            type=int,
+            default=0,
+            help="Only export items after this id, to resume an interrupted export",
+        )
+        parser.add_argument("--gzip", action="store_true", help="Compress the output")
+
+    def handle(self, *args, **options):
+        lines = export_lines(options["after"])
+        if options["gzip"]:
+            lines = gzip_lines(lines)
+
+        # Appending lets an export resumed with --after continue the same file
+        output = (
+            open(options["output"], "ab") if options["output"] else sys.stdout.buffer
+        )
+        try:
+            for chunk in lines:
+                output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from items.sitemaps import write_sitemaps
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the sitemap index and the section pages that changed to storage. "
+        "Run it on a schedule; the stored sitemaps are not updated otherwise."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Render every page, even those whose rows look unchanged",
+        )
+
+    def handle(self, *args, **options):
+        written, deleted = write_sitemaps(full=options["full"])
+
+        for filename in written:
+            self.stdout.write(f"Wrote {filename}")
+        for filename in deleted:
+            self.stdout.write(f"Deleted {filename}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully generated sitemaps: {len(written)} pages written, "
+                f"{len(deleted)} deleted"
+            )
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from items.models import Tag
+from items.tags import merge_tags
+
+
+class Command(BaseCommand):
+    help = "Merge one or more tags into a target tag, creating the target if needed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("sources", nargs="+", help="Names of the tags to merge")
+        parser.add_argument(
+            "--into", required=True, help="Name of the tag to merge them into"
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the impact without changing anything",
+        )
+
+    def handle(self, *args, **options):
+        sources = options["sources"]
+        target = options["into"]
+
+        found = set(Tag.objects.filter(name__in=sources).values_list("name", flat=True))
+        missing = [name for name in sources if name not in found and name != target]
+        if missing:
+            raise CommandError(f"Tags not found: {', '.join(missing)}")
+
+        impact = merge_tags(sources, target, dry_run=options["dry_run"])
+
+        for name, count in impact["sources"].items():
+            self.stdout.write(f'"{name}" is on {count} items')
+
+        if options["dry_run"]:
+            if impact["created"]:
+                self.stdout.write(f'Would create "{target}"')
+            self.stdout.write(
+                f'Would tag {impact["added"]} more items with "{target}" '
+                f'and remove {impact["removed"]} taggings'
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully merged {", ".join(sources)} into "{target}": '
+                f'tagged {impact["added"]} more items, removed {impact["removed"]} taggings'
+            )
+        )
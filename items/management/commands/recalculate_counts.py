@@ -1,144 +1,134 @@
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
-from django.db.models import (
-    Count,
-    Subquery,
-    OuterRef,
-    IntegerField,
-    FloatField,
-    Avg,
-    ExpressionWrapper,
-    F,
-    Max,
-    Q,
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from items.changes import TRACKED_MODELS, record_changes
+from items.counts import COUNTED_MODELS, drifted
+from items.models import (
+    Change,
+    Item,
+    Download,
+    Review,
+    Screenshot,
+    StaleCount,
+    Version,
+    Tag,
+    Watermark,
 )
-from django.db.models.functions import Coalesce
-
-from items.models import Item, Download, Review, Screenshot, Version, Tag
 from django.contrib.auth import get_user_model
 
 
 User = get_user_model()
 
+WATERMARK_NAME = "recalculate_counts"
+
+# Rows saved in a transaction that commits after a run starts can carry an
+# updated_at older than that run's watermark, so each run looks back a little.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
 
 class Command(BaseCommand):
     help = "Recalculate download, review, and screenshot counts for each item"
 
-    def handle(self, *args, **options):
-        versions = Version.objects.all().annotate(
-            new_downloads_count=Coalesce(
-                Subquery(
-                    Download.objects.filter(version=OuterRef("pk"))
-                    .values("version")
-                    .annotate(c=Count("id"))
-                    .values("c"),
-                    output_field=IntegerField(),
-                ),
-                0,
-            ),
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only recalculate items and users touched since the last incremental run. "
+            "Deleted items, versions, reviews and screenshots are always picked up, "
+            "downloads only when deleted from the admin or with their user; "
+            "after deleting downloads any other way, run without --incremental.",
         )
 
-        for version in versions:
-            Version.objects.filter(pk=version.pk).update(
-                downloads_count=version.new_downloads_count
-            )
+    def handle(self, *args, **options):
+        # Rows marked after this are left for the next run
+        last_stale = StaleCount.objects.aggregate(last=Max("pk"))["last"] or 0
+        stale = StaleCount.objects.filter(pk__lte=last_stale)
 
-        # Calculate tag counts
-        tags = (
-            Item.tags.through.objects.all()
-            .values("tag")
-            .annotate(c=Count("item"))
-            .values("tag", "c")
-        )
+        if not options["incremental"]:
+            self.recalculate(
+                Version.objects.all(), Item.objects.all(), User.objects.all()
+            )
+            stale.delete()
+            return
 
-        for tag in tags:
-            Tag.objects.filter(id=tag["tag"]).update(count=tag["c"])
-
-        items = (
-            Item.objects.all()
-            .annotate(
-                new_downloads_count=Coalesce(
-                    Subquery(
-                        Download.objects.filter(version__item=OuterRef("pk"))
-                        .values("version__item")
-                        .annotate(c=Count("id"))
-                        .values("c"),
-                        output_field=IntegerField(),
-                    ),
-                    0,
-                ),
-                new_reviews_count=Coalesce(
-                    Subquery(
-                        Review.objects.filter(version__item=OuterRef("pk"))
-                        .values("version__item")
-                        .annotate(c=Count("id"))
-                        .values("c"),
-                        output_field=IntegerField(),
-                    ),
-                    0,
-                ),
-                new_screenshots_count=Coalesce(
-                    Subquery(
-                        Screenshot.objects.filter(item=OuterRef("pk"))
-                        .values("item")
-                        .annotate(c=Count("id"))
-                        .values("c"),
-                        output_field=IntegerField(),
-                    ),
-                    0,
-                ),
-                new_rating_average=Coalesce(
-                    Subquery(
-                        Review.objects.filter(version__item=OuterRef("pk"))
-                        .values("version__item")
-                        .annotate(avg=Avg("rating"))
-                        .values("avg"),
-                        output_field=FloatField(),
-                    ),
-                    0.0,
-                ),
+        with transaction.atomic():
+            # Locking the watermark row keeps overlapping runs from interleaving
+            watermark, created = Watermark.objects.select_for_update().get_or_create(
+                name=WATERMARK_NAME, defaults={"value": timezone.now()}
             )
-            .annotate(
-                new_rating_weighted=ExpressionWrapper(
-                    F("new_rating_average")
-                    + (F("new_rating_average") - 2.5) * (F("new_reviews_count") / 10.0),
-                    output_field=FloatField(),
-                ),
-                new_version_created_at=Coalesce(Max("versions__created_at"), None),
+            run_started_at = timezone.now()
+
+            if created:
+                self.recalculate(
+                    Version.objects.all(), Item.objects.all(), User.objects.all()
+                )
+            else:
+                touched = Q(updated_at__gt=watermark.value - WATERMARK_OVERLAP)
+
+                def stale_ids(label):
+                    return stale.filter(model=label).values("object_id")
+
+                versions = Version.objects.filter(
+                    touched
+                    | Q(pk__in=Download.objects.filter(touched).values("version"))
+                    | Q(pk__in=stale_ids("version"))
+                )
+                items = Item.objects.filter(
+                    touched
+                    | Q(pk__in=stale_ids("item"))
+                    | Q(
+                        pk__in=Version.objects.filter(
+                            pk__in=stale_ids("version")
+                        ).values("item")
+                    )
+                    | Q(pk__in=Version.objects.filter(touched).values("item"))
+                    | Q(pk__in=Download.objects.filter(touched).values("version__item"))
+                    | Q(pk__in=Review.objects.filter(touched).values("version__item"))
+                    | Q(pk__in=Screenshot.objects.filter(touched).values("item"))
+                )
+                users = User.objects.filter(
+                    Q(pk__in=stale_ids("user"))
+                    | Q(pk__in=Item.objects.filter(touched).values("user"))
+                    | Q(pk__in=Review.objects.filter(touched).values("user"))
+                )
+
+                self.recalculate(versions, items, users)
+
+            stale.delete()
+            watermark.value = run_started_at
+            watermark.save()
+
+    def recalculate(self, versions, items, users):
+        # The item-tag through table has no timestamps, but there are few
+        # enough tags to recount all of them on every run.
+        querysets = {
+            "version": versions,
+            "tag": Tag.objects.all(),
+            "item": items,
+            "user": users,
+        }
+
+        for label, (Model, annotate_counts, fields) in COUNTED_MODELS.items():
+            # Only rows that have drifted are fetched and written back
+            rows = list(
+                drifted(querysets[label], annotate_counts, fields).values(
+                    "pk", *(f"new_{field}" for field in fields)
+                )
             )
-        )
-
-        for item in items:
-            updates = {
-                "downloads_count": item.new_downloads_count,
-                "reviews_count": item.new_reviews_count,
-                "screenshots_count": item.new_screenshots_count,
-                "rating_average": item.new_rating_average,
-                "rating_weighted": item.new_rating_weighted,
-                "version_created_at": item.new_version_created_at,
-            }
-
-            Item.objects.filter(pk=item.pk).update(**updates)
-
-        self.stdout.write(self.style.SUCCESS("Successfully recalculated item counts"))
-
-        # Calculate User items and reviews counts
-        User.objects.update(items_count=0, reviews_count=0)
 
-        users = (
-            User.objects.all()
-            .annotate(
-                new_items_count=Count("items", distinct=True),
-                new_reviews_count=Count("reviews", distinct=True),
+            for row in rows:
+                Model.objects.filter(pk=row["pk"]).update(
+                    **{field: row[f"new_{field}"] for field in fields}
+                )
+            if label in TRACKED_MODELS:
+                record_changes(Model, [row["pk"] for row in rows], Change.UPDATED)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Successfully recalculated {len(rows)} {label} counts"
+                )
             )
-            .filter(Q(new_items_count__gt=0) | Q(new_reviews_count__gt=0))
-        )
-
-        for user in users:
-            updates = {
-                "items_count": user.new_items_count,
-                "reviews_count": user.new_reviews_count,
-            }
-
-            User.objects.filter(pk=user.pk).update(**updates)
-
-        self.stdout.write(self.style.SUCCESS("Successfully recalculated user counts"))
@@ -1,23 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.db.models import Value
 from django.db.models.functions import Replace
-from django.core.management.base import BaseCommand
 
-from items.models import Review, Item, Version, Screenshot
+from items.changes import record_changes
+from items.models import Change, Review, Item, Version, Screenshot
+
+TEXT_FIELDS = {
+    Item: ["name", "body"],
+    Version: ["name", "body"],
+    Review: ["title", "body"],
+    Screenshot: ["title"],
+}
 
 
 class Command(BaseCommand):
     help = 'Replaces all instances of "" with " in all TextField fields'
 
+    @transaction.atomic
     def handle(self, *args, **options):
-        Item.objects.update(name=Replace("name", Value('""'), Value('"')))
-        Item.objects.update(body=Replace("body", Value('""'), Value('"')))
-
-        Version.objects.update(name=Replace("name", Value('""'), Value('"')))
-        Version.objects.update(body=Replace("body", Value('""'), Value('"')))
-
-        Review.objects.update(title=Replace("title", Value('""'), Value('"')))
-        Review.objects.update(body=Replace("body", Value('""'), Value('"')))
-
-        Screenshot.objects.update(title=Replace("title", Value('""'), Value('"')))
+        for Model, fields in TEXT_FIELDS.items():
+            for field in fields:
+                rows = Model.objects.filter(**{f"{field}__contains": '""'})
+                # update() skips the signals that log changes for mirrors
+                record_changes(Model, rows.values_list("pk", flat=True), Change.UPDATED)
+                rows.update(**{field: Replace(field, Value('""'), Value('"'))})
 
         self.stdout.write(self.style.SUCCESS('Successfully replaced "" with "'))
@@ -83,6 +83,45 @@ class TimeStampMixin(models.Model):
         abstract = True
 
 
+class Watermark(models.Model):
+    # High-water marks for jobs that only process rows changed since their last run
+    name = models.CharField(max_length=255, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} at {self.value}"
+
+
+class StaleCount(models.Model):
+    # Rows whose cached counts a bulk or cascading delete may have left wrong,
+    # for recalculate_counts --incremental to repair
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
+class Change(models.Model):
+    # Append-only log of catalog edits, read by /api/changes/ to sync mirrors.
+    # Bulk writes are logged with record_changes; counters bumped by downloads
+    # and reviews are not.
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(
+        max_length=10,
+        choices=[(CREATED, "Created"), (UPDATED, "Updated"), (DELETED, "Deleted")],
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} {self.action}"
+
+
 class User(AbstractUser):
     # Cached / calculated fields
     items_count = models.PositiveIntegerField(default=0)
@@ -0,0 +1,83 @@
+from django.conf import settings
+from rest_framework import pagination
+
+# Fields a cursor can position on. A cursor only remembers the first field of
+# the ordering, so one led by a count or rating, which change while a client
+# pages through, would skip or repeat rows.
+CURSOR_FIELDS = {"pk", "id", "created_at", "version_created_at"}
+
+
+class LinkHeaderMixin:
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+
+        # Clients can follow pages without parsing the body
+        links = [
+            f'<{url}>; rel="{rel}"'
+            for url, rel in [
+                (self.get_next_link(), "next"),
+                (self.get_previous_link(), "prev"),
+            ]
+            if url
+        ]
+        if links:
+            response["Link"] = ", ".join(links)
+
+        return response
+
+
+class PageNumberPagination(LinkHeaderMixin, pagination.PageNumberPagination):
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class ListPagination(LinkHeaderMixin, pagination.CursorPagination):
+    """
+    Pages through a table by primary key, or by the view's own ordering, so
+    a page costs the same at any depth and rows added while a client pages
+    through are not repeated.
+
+    Orders led by anything but a creation time or the primary key, such as
+    ?order=popular or a search, are paged by ?page= number instead, with the
+    primary key breaking ties. Rows moving up or down while a client pages
+    through can still be seen twice or not at all there, as on the site.
+    """
+
+    ordering = "-pk"
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.pages = None
+
+        ordering = self.get_ordering(request, queryset, view)
+        if ordering[0].lstrip("-") not in CURSOR_FIELDS:
+            self.pages = PageNumberPagination()
+            page = self.pages.paginate_queryset(
+                queryset.order_by(*ordering), request, view
+            )
+            self.display_page_controls = self.pages.display_page_controls
+            return page
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        # A queryset the view ordered itself is paged in that order, with the
+        # primary key breaking ties so the cursor stays stable
+        ordering = tuple(queryset.query.order_by)
+        if not ordering:
+            return super().get_ordering(request, queryset, view)
+
+        if "pk" not in ordering and "-pk" not in ordering:
+            ordering += ("-pk",)
+        return ordering
+
+    def get_paginated_response(self, data):
+        if self.pages is not None:
+            return self.pages.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.pages is not None:
+            return self.pages.to_html()
+        return super().to_html()
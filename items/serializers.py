@@ -1,52 +1,88 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from .models import Item, Version, Download, Review, Screenshot, Tag
+from .models import Change, Item, Version, Download, Review, Screenshot, Tag
 
 
-class UserSerializer(serializers.ModelSerializer):
+class ReadOnlyModelSerializer(serializers.ModelSerializer):
+    """
+    Makes every field read-only, which DRF does not allow through
+    read_only_fields = "__all__". Passing fields limits the output to those
+    field names, and expand replaces the named fields with the nested
+    serializers listed in Meta.expandable.
+    """
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+        for name in expand:
+            self.fields[name] = self.Meta.expandable[name]()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for field in fields.values():
+            field.read_only = True
+        return fields
+
+
+class UserSerializer(ReadOnlyModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ["id", "username", "first_name", "items_count", "reviews_count"]
-        read_only_fields = "__all__"
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(ReadOnlyModelSerializer):
     class Meta:
         model = Item
         fields = "__all__"
-        read_only_fields = "__all__"
+        expandable = {
+            "versions": lambda: VersionSerializer(many=True),
+            "screenshots": lambda: ScreenshotSerializer(many=True),
+            "tags": lambda: TagSerializer(many=True),
+            "user": lambda: UserSerializer(),
+        }
 
 
-class VersionSerializer(serializers.ModelSerializer):
+class VersionSerializer(ReadOnlyModelSerializer):
     class Meta:
         model = Version
         fields = "__all__"
-        read_only_fields = "__all__"
 
 
-class DownloadSerializer(serializers.ModelSerializer):
+class DownloadSerializer(ReadOnlyModelSerializer):
     class Meta:
         model = Download
         fields = "__all__"
-        read_only_fields = "__all__"
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(ReadOnlyModelSerializer):
     class Meta:
         model = Review
         fields = "__all__"
-        read_only_fields = "__all__"
 
 
-class ScreenshotSerializer(serializers.ModelSerializer):
+class ScreenshotSerializer(ReadOnlyModelSerializer):
     class Meta:
         model = Screenshot
         fields = "__all__"
-        read_only_fields = "__all__"
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ReadOnlyModelSerializer):
     class Meta:
         model = Tag
         fields = "__all__"
-        read_only_fields = "__all__"
+
+
+class ChangeSerializer(ReadOnlyModelSerializer):
+    # The current state of the changed object, or None once it is deleted
+    object = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Change
+        fields = ["id", "model", "object_id", "action", "created_at", "object"]
+
+    def get_object(self, change):
+        return self.context["objects"].get((change.model, change.object_id))
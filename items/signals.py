@@ -1,11 +1,25 @@
 import discord
 import asyncio
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 import threading
 
 from s7 import settings
-from .models import Version, Review
+from .changes import record_change
+from .counts import mark_stale
+from .feeds import clear_feeds
+from .forms import clear_item_form_choices
+from .models import (
+    Change,
+    Download,
+    Item,
+    Version,
+    Review,
+    Screenshot,
+    Tag,
+    User,
+)
+from .tags import tags_changed
 
 
 def send_discord_message(channel_id, content):
@@ -52,3 +66,71 @@ def notify_discord(sender, instance, created, **kwargs):
 
     content = f"{settings.CANONICAL_DOMAIN}{instance.get_absolute_url()}"
     send_discord_message(channel_id, content)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Item.tags.through)
+@receiver(tags_changed)
+def invalidate_item_form_choices(sender, **kwargs):
+    clear_item_form_choices()
+
+
+@receiver(post_save, sender=Version)
+@receiver(post_delete, sender=Version)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(tags_changed)
+def invalidate_feeds(sender, **kwargs):
+    clear_feeds()
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Version)
+@receiver(post_save, sender=Screenshot)
+@receiver(post_save, sender=Review)
+def log_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    record_change(instance, Change.CREATED if created else Change.UPDATED)
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Version)
+@receiver(post_delete, sender=Screenshot)
+@receiver(post_delete, sender=Review)
+def log_deletion(sender, instance, **kwargs):
+    record_change(instance, Change.DELETED)
+
+
+# Bulk and cascading deletes skip the count updates in the models' delete()
+STALE_PARENTS = {
+    Item: [("user", "user_id")],
+    Version: [("item", "item_id")],
+    Review: [("version", "version_id"), ("user", "user_id")],
+    Screenshot: [("item", "item_id")],
+}
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Version)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Screenshot)
+def mark_parent_counts_stale(sender, instance, **kwargs):
+    for label, attname in STALE_PARENTS[sender]:
+        mark_stale(label, [getattr(instance, attname)])
+
+
+@receiver(pre_delete, sender=User)
+def mark_download_counts_stale(sender, instance, **kwargs):
+    # Downloads have no delete receivers so cascades stay fast; note the
+    # versions whose counts the user's downloads are about to leave wrong
+    mark_stale(
+        "version",
+        Download.objects.filter(user=instance).values_list("version", flat=True),
+    )
@@ -1,35 +1,92 @@
+import hashlib
+import json
+from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sitemaps import Sitemap
-from django.urls import reverse
+from django.contrib.sitemaps.views import SitemapIndexItem, sitemap
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import path, reverse
+from django.utils.functional import cached_property
 
 from .models import Item, Tag
 
 User = get_user_model()
 
+# Well under the protocol's 50,000 URLs, so one edit rewrites a small file
+SITEMAP_PAGE_SIZE = 10000
+
+SITEMAP_DIRECTORY = "sitemaps"
+SITEMAP_INDEX = "sitemap.xml"
+SITEMAP_MANIFEST = "manifest.json"
+
+
+class PagedSitemap(Sitemap):
+    # Fields that go into a page's URLs and lastmods. A page whose rows have
+    # the same values for them as last time needs no rendering. None renders
+    # it every time.
+    fingerprint_fields = None
+
+    @cached_property
+    def paginator(self):
+        # Counted once, rather than once per page
+        return Paginator(self._items(), self.limit)
+
+    def fingerprint(self, page):
+        if self.fingerprint_fields is None:
+            return None
+
+        start = (page - 1) * self.limit
+        rows = self.items()[start : start + self.limit].values_list(
+            "pk", *self.fingerprint_fields
+        )
+        digest = hashlib.md5()
+        for row in rows.iterator():
+            digest.update(repr(row).encode())
+        return digest.hexdigest()
 
-class ItemsSitemap(Sitemap):
+
+class ItemsSitemap(PagedSitemap):
     changefreq = "monthly"
     priority = 1
+    fingerprint_fields = ["permalink", "version_created_at"]
 
     def items(self):
-        return Item.objects.exclude(version_created_at__isnull=True)
+        return (
+            Item.objects.exclude(version_created_at__isnull=True)
+            .only("permalink", "version_created_at")
+            .order_by("pk")
+        )
 
     def lastmod(self, obj):
         return obj.version_created_at
 
 
-class UserSitemap(Sitemap):
+class UserSitemap(PagedSitemap):
     changefreq = "monthly"
     priority = 0.5
+    fingerprint_fields = ["username", "date_joined"]
 
     def items(self):
-        return User.objects.all()
+        return (
+            User.objects.filter(Q(items_count__gt=0) | Q(reviews_count__gt=0))
+            .only("username", "date_joined")
+            .order_by("pk")
+        )
 
     def lastmod(self, obj):
         return obj.date_joined
 
 
-class StaticViewSitemap(Sitemap):
+class StaticViewSitemap(PagedSitemap):
     priority = 0.6
     changefreq = "monthly"
 
@@ -40,12 +97,13 @@ class StaticViewSitemap(Sitemap):
         return reverse(item)
 
 
-class TagSitemap(Sitemap):
+class TagSitemap(PagedSitemap):
     changefreq = "monthly"
     priority = 0.6
+    fingerprint_fields = ["permalink"]
 
     def items(self):
-        return Tag.objects.all()
+        return Tag.objects.only("permalink").order_by("pk")
 
     def location(self, item):
         return reverse("tag", args=[item.permalink])
@@ -57,3 +115,132 @@ sitemaps = {
     "static": StaticViewSitemap,
     "tags": TagSitemap,
 }
+
+
+def sitemap_filename(section, page):
+    return f"sitemap-{section}-{page}.xml"
+
+
+def sitemap_storage_path(filename):
+    return f"{SITEMAP_DIRECTORY}/{filename}"
+
+
+def save_sitemap_file(filename, content):
+    name = sitemap_storage_path(filename)
+    # Some storages pick a new name rather than overwrite
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(content))
+
+
+def write_sitemaps(full=False):
+    """
+    Saves the pages of every section that changed since the last run, then the
+    index pointing at them. A page whose rows have the same fingerprint as last
+    time is not rendered again, unless full is set. Returns the names of the
+    pages written and deleted.
+
+    Nothing calls this on its own: schedule generate_sitemaps to keep the
+    stored sitemaps current.
+    """
+    manifest_name = sitemap_storage_path(SITEMAP_MANIFEST)
+    manifest = {}
+    if default_storage.exists(manifest_name):
+        with default_storage.open(manifest_name) as f:
+            manifest = json.load(f)
+
+    canonical = urlsplit(settings.CANONICAL_DOMAIN)
+    site = SimpleNamespace(domain=canonical.netloc)
+
+    index = []
+    new_manifest = {}
+    written = []
+
+    for section, sitemap_class in sitemaps.items():
+        site_map = sitemap_class()
+        # Stored pages are smaller than the protocol allows, so an edit only
+        # rewrites a small file
+        site_map.limit = SITEMAP_PAGE_SIZE
+
+        for page in site_map.paginator.page_range:
+            filename = sitemap_filename(section, page)
+            entry = manifest.get(filename)
+            if not isinstance(entry, dict):
+                entry = {}
+
+            fingerprint = site_map.fingerprint(page)
+            if full or fingerprint is None or entry.get("fingerprint") != fingerprint:
+                urls = site_map.get_urls(
+                    page=page, site=site, protocol=canonical.scheme
+                )
+                content = render_to_string("sitemap.xml", {"urlset": urls}).encode()
+                digest = hashlib.md5(content).hexdigest()
+
+                if entry.get("digest") != digest:
+                    save_sitemap_file(filename, content)
+                    written.append(filename)
+
+                lastmods = [url["lastmod"] for url in urls if url["lastmod"]]
+                lastmod = max(lastmods, default=None)
+                entry = {
+                    "fingerprint": fingerprint,
+                    "digest": digest,
+                    "lastmod": lastmod and lastmod.isoformat(),
+                }
+
+            new_manifest[filename] = entry
+            index.append(
+                SitemapIndexItem(
+                    f"{settings.CANONICAL_DOMAIN}/{filename}",
+                    entry["lastmod"] and datetime.fromisoformat(entry["lastmod"]),
+                )
+            )
+
+    deleted = [filename for filename in manifest if filename not in new_manifest]
+    for filename in deleted:
+        default_storage.delete(sitemap_storage_path(filename))
+
+    save_sitemap_file(
+        SITEMAP_INDEX,
+        render_to_string("sitemap_index.xml", {"sitemaps": index}).encode(),
+    )
+    save_sitemap_file(SITEMAP_MANIFEST, json.dumps(new_manifest).encode())
+
+    return written, deleted
+
+
+def stored_sitemap(filename):
+    name = sitemap_storage_path(filename)
+    if not default_storage.exists(name):
+        return None
+
+    with default_storage.open(name) as f:
+        response = HttpResponse(f.read(), content_type="application/xml")
+    response.headers["X-Robots-Tag"] = "noindex, noodp, noarchive"
+    return response
+
+
+def sitemap_index(request):
+    # Until generate_sitemaps has run, render a single sitemap on each request
+    return stored_sitemap(SITEMAP_INDEX) or sitemap(request, sitemaps)
+
+
+def sitemap_section(request, section, page):
+    response = stored_sitemap(sitemap_filename(section, page))
+    if response is None:
+        raise Http404("No such sitemap")
+    return response
+
+
+sitemap_paths = [
+    path(
+        "sitemap.xml",
+        sitemap_index,
+        name="django.contrib.sitemaps.views.sitemap",
+    ),
+    path(
+        "sitemap-<slug:section>-<int:page>.xml",
+        sitemap_section,
+        name="sitemap_section",
+    ),
+]
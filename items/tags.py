@@ -0,0 +1,134 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef
+from django.dispatch import Signal
+from django.utils.text import slugify
+
+from .changes import record_changes
+from .counts import count_subquery
+from .models import Change, Item, Tag
+
+ItemTag = Item.tags.through
+
+# Sent after the bulk writes below, which skip the save, delete and
+# m2m_changed signals that caches are invalidated by
+tags_changed = Signal()
+
+
+def recount_tags(tag_ids):
+    Tag.objects.filter(pk__in=tag_ids).update(
+        count=count_subquery(ItemTag.objects.filter(tag=OuterRef("pk")), "tag")
+    )
+
+
+@transaction.atomic
+def set_item_tags(item, tags, tag_names):
+    """
+    Makes item's tags exactly tags plus the tags named in tag_names, creating
+    any missing names. Only the through rows and counts that change are
+    written.
+    """
+    wanted = {tag.pk for tag in tags}
+
+    existing = dict(
+        Tag.objects.filter(name__in=tag_names).order_by("-pk").values_list("name", "pk")
+    )
+    new_tags = Tag.objects.bulk_create(
+        [
+            Tag(name=name, permalink=slugify(name))
+            for name in dict.fromkeys(tag_names)
+            if name not in existing
+        ]
+    )
+    wanted.update(existing.values())
+    wanted.update(tag.pk for tag in new_tags)
+
+    current = set(ItemTag.objects.filter(item=item).values_list("tag", flat=True))
+    added = wanted - current
+    removed = current - wanted
+
+    if added:
+        ItemTag.objects.bulk_create(
+            [ItemTag(item_id=item.pk, tag_id=tag_id) for tag_id in added]
+        )
+        Tag.objects.filter(pk__in=added).update(count=F("count") + 1)
+
+    if removed:
+        ItemTag.objects.filter(item=item, tag__in=removed).delete()
+        Tag.objects.filter(pk__in=removed, count__gt=0).update(count=F("count") - 1)
+
+    if added or removed:
+        record_changes(Item, [item.pk], Change.UPDATED)
+
+    if new_tags or added or removed:
+        tags_changed.send(sender=Tag)
+
+
+@transaction.atomic
+def merge_tags(source_names, target_name, dry_run=False):
+    """
+    Moves every item tagged with any of source_names onto target_name and
+    deletes the source tags. Tags sharing the target's name are folded into
+    the oldest of them. Returns a summary of what changed (or would change).
+    """
+    targets = list(Tag.objects.filter(name=target_name).order_by("pk"))
+    target = targets[0] if targets else None
+
+    source_ids = set(
+        Tag.objects.filter(name__in=source_names).values_list("pk", flat=True)
+    )
+    source_ids.update(tag.pk for tag in targets[1:])
+    if target is not None:
+        source_ids.discard(target.pk)
+
+    source_rows = ItemTag.objects.filter(tag__in=source_ids)
+    missing_item_ids = list(
+        source_rows.exclude(item__in=ItemTag.objects.filter(tag=target).values("item"))
+        .values_list("item", flat=True)
+        .distinct()
+    )
+
+    impact = {
+        "sources": dict(
+            Tag.objects.filter(pk__in=source_ids)
+            .annotate(c=Count("item"))
+            .values_list("name", "c")
+        ),
+        "target": target_name,
+        "created": target is None,
+        "added": len(missing_item_ids),
+        "removed": source_rows.count(),
+    }
+
+    if dry_run:
+        return impact
+
+    if target is None:
+        target = Tag.objects.create(name=target_name)
+
+    ItemTag.objects.bulk_create(
+        [ItemTag(item_id=item_id, tag_id=target.pk) for item_id in missing_item_ids]
+    )
+    record_changes(Item, source_rows.values_list("item", flat=True), Change.UPDATED)
+    source_rows.delete()
+    Tag.objects.filter(pk__in=source_ids).delete()
+    recount_tags([target.pk])
+    tags_changed.send(sender=Tag)
+
+    return impact
+
+
+@transaction.atomic
+def remove_tag_where_tagged(tag_name, other_tag_name):
+    """Removes tag_name from every item that is also tagged with other_tag_name."""
+    tag_ids = Tag.objects.filter(name=tag_name).values_list("pk", flat=True)
+    rows = ItemTag.objects.filter(
+        tag__in=tag_ids,
+        item__in=ItemTag.objects.filter(tag__name=other_tag_name).values("item"),
+    )
+    record_changes(Item, rows.values_list("item", flat=True), Change.UPDATED)
+    removed, _ = rows.delete()
+    recount_tags(tag_ids)
+    if removed:
+        tags_changed.send(sender=Tag)
+
+    return removed
@@ -3,7 +3,8 @@ import markdown
 
 from django.utils.html import strip_tags
 from django import template
-from django.urls import resolve, Resolver404
+
+from ..utils import get_view_name
 
 register = template.Library()
 
@@ -22,17 +23,17 @@ def url_replace(context, **kwargs):
 @register.simple_tag(takes_context=True)
 def subtitle(context):
     subtitle = ""
-    view = resolve(context["request"].path_info)
+    view_name = get_view_name(context["request"])
     order = context["request"].GET.get("order")
     search = context["request"].GET.get("search")
 
-    if view.view_name in ["home", "items"]:
+    if view_name in ["home", "items"]:
         subtitle = "Downloads"
         if not order:
             subtitle = "Latest Downloads"
-    elif view.view_name == "scenario":
+    elif view_name == "scenario":
         subtitle = f"Downloads for {context['scenario'].name}"
-    elif view.view_name == "tag":
+    elif view_name == "tag":
         subtitle = f"Tagged '{context['tag'].name.capitalize()}'"
     if order:
         subtitle += order_name(order)
@@ -46,9 +47,8 @@ def subtitle(context):
 def pagetitle(context):
     prefix = "Marathon Aleph One Downloads"
 
-    try:
-        view = resolve(context["request"].path_info)
-    except Resolver404:
+    view_name = get_view_name(context["request"])
+    if view_name is None:
         return "Page not found"  # Default title for unmatched paths
 
     if context["request"].path == "/" and not context["request"].GET:
@@ -57,32 +57,32 @@ def pagetitle(context):
     if "item" in context:
         return f'Download {context["item"].name} by {context["item"].get_byline()}'
 
-    if view.view_name == "user" and "show_user" in context:
+    if view_name == "user" and "show_user" in context:
         return f'{prefix} and Reviews from {context["show_user"].first_name}'
 
-    if view.view_name == "tag":
+    if view_name == "tag":
         return f'{prefix} Tagged "{context["tag"].name.capitalize()}"'
 
-    if view.view_name == "scenario":
+    if view_name == "scenario":
         return f'{prefix} for {context["scenario"].name}'
 
-    if view.view_name == "users":
+    if view_name == "users":
         return "Active members of the Marathon Aleph One community"
 
-    if view.view_name == "review_detail":
+    if view_name == "review_detail":
         return f'Review by {context["review"].user.first_name} for {context["review"].version.item.name}'
 
     items_subtitle = subtitle(context)
     if items_subtitle:
         return items_subtitle
 
-    return view.view_name.capitalize().replace("_", " ")
+    return view_name.capitalize().replace("_", " ")
 
 
 @register.simple_tag(takes_context=True)
 def description(context):
     max_length = 170
-    view = resolve(context["request"].path_info)
+    view_name = get_view_name(context["request"])
 
     def from_markdown(input):
         single_line_text = re.sub("\s+", " ", strip_tags(markdown.markdown(input)))
@@ -91,17 +91,17 @@ def description(context):
 
         return single_line_text
 
-    if view.view_name == "item_detail" and "item" in context:
+    if view_name == "item_detail" and "item" in context:
         return from_markdown(context["item"].body)
 
-    if view.view_name == "user" and "show_user" in context:
+    if view_name == "user" and "show_user" in context:
         show_user = context["show_user"]
         return (
             f"{show_user.first_name} is a member of the Marathon Aleph One community with "
             + f"{show_user.items_count} uploads and {show_user.reviews_count} reviews."
         )
 
-    if view.view_name == "review_detail" and "review" in context:
+    if view_name == "review_detail" and "review" in context:
         return from_markdown(context["review"].body)
 
     return (
@@ -112,10 +112,10 @@ def description(context):
 
 @register.simple_tag(takes_context=True)
 def og_image(context):
-    view = resolve(context["request"].path_info)
+    view_name = get_view_name(context["request"])
 
     if (
-        view.view_name == "item_detail"
+        view_name == "item_detail"
         and "screenshots" in context
         and len(context["screenshots"]) > 0
     ):
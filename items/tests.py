@@ -1,3 +1,983 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+import migrate
+from convert.convert import DumpReader
+from items import throttles
+from items.counts import mark_stale
+from items.feeds import FEED_GENERATION_KEY
+from items.forms import ITEM_FORM_CHOICES_KEY
+from items.models import (
+    Download,
+    Item,
+    Review,
+    StaleCount,
+    Tag,
+    User,
+    Version,
+    Watermark,
+)
+from items.sitemaps import ItemsSitemap
+from items.tags import (
+    ItemTag,
+    merge_tags,
+    recount_tags,
+    remove_tag_where_tagged,
+    set_item_tags,
+)
+from items.utils import get_view_name
+from items.views.api import DownloadViewSet, ReviewViewSet
+
+
+class CopyBatchTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="Item", body="", user=user, permalink="item"
+        )
+        self.tags = [
+            Tag.objects.create(name=name, permalink=name) for name in ("solo", "net")
+        ]
+
+    def taggings(self):
+        return [ItemTag(item_id=self.item.pk, tag_id=tag.pk) for tag in self.tags]
+
+    def test_copy_leaves_out_missing_ids(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+
+        with mock.patch.object(migrate.connection, "cursor", return_value=cursor):
+            migrate.copy_batch(ItemTag, self.taggings())
+
+        sql, buffer = cursor.copy_expert.call_args.args
+        self.assertNotIn('"id"', sql)
+        self.assertEqual(
+            buffer.read().splitlines(),
+            [f"{self.item.pk}\t{tag.pk}" for tag in self.tags],
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+    def test_copy_taggings(self):
+        migrate.copy_batch(ItemTag, self.taggings())
+
+        self.assertEqual(
+            set(ItemTag.objects.values_list("item_id", "tag_id")),
+            {(self.item.pk, tag.pk) for tag in self.tags},
+        )
+
+
+class TransformRowsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="Item", body="", user=user, permalink="item"
+        )
+        self.solo, self.net = [
+            Tag.objects.create(name=name, permalink=name) for name in ("solo", "net")
+        ]
+        self.item.tags.add(self.solo)
+
+    def test_taggings_checked_against_database(self):
+        migrate.notes.clear()
+        rows = migrate.transform_rows(
+            "taggings",
+            [
+                {"id": 1, "taggable_id": self.item.pk, "tag_id": self.solo.pk},
+                {"id": 2, "taggable_id": self.item.pk, "tag_id": self.net.pk},
+                {"id": 3, "taggable_id": self.item.pk, "tag_id": self.net.pk},
+                {"id": 4, "taggable_id": self.item.pk + 1, "tag_id": self.net.pk},
+                {"id": 5, "taggable_id": self.item.pk, "tag_id": self.net.pk + 1},
+            ],
+        )
+
+        # Saved and repeated pairs are skipped, missing rows are noted
+        self.assertEqual(rows, [{"item_id": self.item.pk, "tag_id": self.net.pk}])
+        self.assertEqual(
+            migrate.notes,
+            {"skipped, item missing": 1, "skipped, tag missing": 1},
+        )
+
+
+class DumpReaderTests(SimpleTestCase):
+    dump = (
+        "-- MySQL dump\n"
+        "CREATE TABLE `items` (\n"
+        "  `id` int(11) unsigned NOT NULL AUTO_INCREMENT,\n"
+        "  `name` varchar(255)\n"
+        ") ENGINE=InnoDB DEFAULT CHARSET=latin1;\n"
+        "INSERT INTO `items` VALUES (1,'not unsigned'),(2,'ENGINE=x; (y)'),"
+        "(3,'it\\'s');\n"
+        "INSERT INTO `items` VALUES (4,NULL);\n"
+    )
+
+    def read(self):
+        return list(DumpReader(io.StringIO(self.dump)))
+
+    def test_tiny_chunks(self):
+        expected = [
+            ("sql", self.dump[self.dump.index("CREATE") : self.dump.index("INSERT")]),
+            (
+                "rows",
+                "items",
+                [(1, "not unsigned"), (2, "ENGINE=x; (y)"), (3, "it's")],
+            ),
+            ("rows", "items", [(4, None)]),
+        ]
+        self.assertEqual(self.read(), expected)
+
+        # Every chunk boundary falls somewhere in the dump, headers included
+        for chunk_size in range(1, 16):
+            with mock.patch("convert.convert.CHUNK_SIZE", chunk_size):
+                self.assertEqual(self.read(), expected, f"chunk size {chunk_size}")
+
+    def test_read_dump_seeks_to_group(self):
+        dump = self.dump.replace("not unsigned", "pas signé") + (
+            "CREATE TABLE `tags` (\n  `id` int(11)\n);\n"
+            "INSERT INTO `tags` VALUES (1);\n"
+        )
+        with tempfile.NamedTemporaryFile("w", suffix=".sql") as f:
+            f.write(dump)
+            f.flush()
+            index = migrate.index_dump(f.name)
+            items = list(migrate.read_dump(f.name, index, ["items"]))
+            tags = list(migrate.read_dump(f.name, index, ["tags"]))
+
+        statements = [line + "\n" for line in dump.splitlines() if "INSERT" in line]
+        self.assertEqual(
+            items,
+            [("items", ["id", "name"], statement) for statement in statements[:2]],
+        )
+        self.assertEqual(tags, [("tags", ["id"], statements[2])])
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"download": "3/min"},
+    }
+)
+class DownloadThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttles.local_cache.clear()
+        user = User.objects.create(username="author")
+        item = Item.objects.create(name="Item", body="", user=user, permalink="item")
+        Version.objects.create(item=item, name="1.0", link="https://example.com/")
+        self.url = reverse("item_download", args=["item"])
+
+    def assert_throttled_after(self, downloads):
+        for _ in range(downloads):
+            self.assertEqual(self.client.get(self.url).status_code, 302)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "20")
+
+    def test_fourth_download_is_throttled(self):
+        self.assert_throttled_after(3)
+        self.assertEqual(Version.objects.get().downloads_count, 3)
+
+    def test_unreachable_cache_throttles_locally(self):
+        with mock.patch.object(
+            throttles.caches["default"], "get", side_effect=ConnectionError
+        ):
+            self.assert_throttled_after(3)
+
+
+class ItemPaginationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        published = timezone.now()
+        self.items = [
+            Item.objects.create(
+                name=f"Item {i}",
+                body="",
+                user=user,
+                permalink=f"item-{i}",
+                version_created_at=published,
+            )
+            for i in range(5)
+        ]
+
+    def page_through(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item["id"] for item in response.json()["results"]]
+            url = response.json()["next"]
+        return ids
+
+    def test_tied_order_pages_by_number(self):
+        ids = self.page_through("/api/items/?order=popular&page_size=2")
+
+        self.assertEqual(ids, sorted((item.pk for item in self.items), reverse=True))
+
+        response = self.client.get("/api/items/?order=popular&page_size=2&page=2")
+        self.assertEqual(response.json()["count"], 5)
+        self.assertIn('rel="next"', response["Link"])
+        self.assertIn('rel="prev"', response["Link"])
+
+    def test_default_order_pages_by_cursor(self):
+        ids = self.page_through("/api/items/?page_size=2")
+
+        self.assertEqual(ids, sorted((item.pk for item in self.items), reverse=True))
+        self.assertNotIn("count", self.client.get("/api/items/").json())
+
+    def test_page_out_of_range(self):
+        response = self.client.get("/api/items/?order=popular&page_size=2&page=9")
+        self.assertEqual(response.status_code, 404)
+
+
+class TagCacheTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="Item", body="", user=user, permalink="item"
+        )
+        for name in ("solo", "net"):
+            self.item.tags.add(Tag.objects.create(name=name, permalink=name))
+
+    def assert_clears_caches(self, change):
+        cache.set(FEED_GENERATION_KEY, 1)
+        cache.set(ITEM_FORM_CHOICES_KEY, [])
+        change()
+        self.assertIsNone(cache.get(FEED_GENERATION_KEY))
+        self.assertIsNone(cache.get(ITEM_FORM_CHOICES_KEY))
+
+    def test_merge_clears_caches(self):
+        self.assert_clears_caches(lambda: merge_tags(["solo"], "net"))
+
+    def test_remove_clears_caches(self):
+        self.assert_clears_caches(lambda: remove_tag_where_tagged("solo", "net"))
+
+    def test_dry_run_keeps_caches(self):
+        cache.set(FEED_GENERATION_KEY, 1)
+        merge_tags(["solo"], "net", dry_run=True)
+        self.assertEqual(cache.get(FEED_GENERATION_KEY), 1)
+
+
+class SitemapFingerprintTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        published = timezone.now()
+        for i in range(3):
+            Item.objects.create(
+                name=f"Item {i}",
+                body="",
+                user=user,
+                permalink=f"item-{i}",
+                version_created_at=published,
+            )
+
+    def fingerprint(self):
+        site_map = ItemsSitemap()
+        site_map.limit = 2
+        return [site_map.fingerprint(page) for page in site_map.paginator.page_range]
+
+    def test_unchanged_rows_keep_fingerprint(self):
+        before = self.fingerprint()
+        Item.objects.filter(permalink="item-0").update(body="edited")
+        self.assertEqual(self.fingerprint(), before)
+
+    def test_changed_url_changes_only_its_page(self):
+        before = self.fingerprint()
+        Item.objects.filter(permalink="item-2").update(permalink="renamed")
+        after = self.fingerprint()
+        self.assertEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_swapped_lastmods_change_fingerprint(self):
+        # Same count, id sum and latest date, which a summary would not notice
+        Item.objects.filter(permalink="item-0").update(
+            version_created_at=timezone.now() - timedelta(days=1)
+        )
+        before = self.fingerprint()
+        Item.objects.filter(permalink="item-0").update(
+            version_created_at=Item.objects.get(permalink="item-1").version_created_at
+        )
+        Item.objects.filter(permalink="item-1").update(
+            version_created_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertNotEqual(self.fingerprint(), before)
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="author")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = Item.objects.create(
+                name="Item", body="", user=self.user, permalink="item"
+            )
+
+    def changes(self, **params):
+        response = self.client.get("/api/changes/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_edits_are_listed_in_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.name = "Renamed"
+            self.item.save()
+
+        results = self.changes()["results"]
+        self.assertEqual(
+            [(change["model"], change["action"]) for change in results],
+            [("item", "created"), ("item", "updated")],
+        )
+        self.assertEqual(results[-1]["object"]["name"], "Renamed")
+
+    def test_since_resumes_after_last_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+
+        first = self.changes(page_size=1)
+        self.assertTrue(first["has_more"])
+
+        rest = self.changes(since=first["next"])
+        self.assertFalse(rest["has_more"])
+        self.assertEqual([change["action"] for change in rest["results"]], ["updated"])
+
+    def test_deleted_object_is_null(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.delete()
+
+        change = self.changes()["results"][-1]
+        self.assertEqual(change["action"], "deleted")
+        self.assertIsNone(change["object"])
+
+    def test_bulk_tag_edits_are_listed(self):
+        for name in ("solo", "net"):
+            self.item.tags.add(Tag.objects.create(name=name, permalink=name))
+        since = self.changes()["next"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            merge_tags(["solo"], "net")
+
+        results = self.changes(since=since)["results"]
+        self.assertEqual(
+            [(change["object_id"], change["action"]) for change in results],
+            [(self.item.pk, "updated")],
+        )
+
+    def test_rolled_back_edits_are_not_listed(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.item.save()
+
+        self.assertEqual(len(self.changes()["results"]), 1)
+
+    def test_bad_since(self):
+        response = self.client.get("/api/changes/", {"since": "soon"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("since", response.json())
+
+
+class CheckCountsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="Item", body="", user=user, permalink="item"
+        )
+        Version.objects.create(item=self.item, name="1.0", link="https://example.com/")
+
+    def check_counts(self, format):
+        stdout = io.StringIO()
+        call_command("check_counts", format=format, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_accurate_counts(self):
+        report = json.loads(self.check_counts("json"))
+        self.assertEqual(report["total"], 0)
+
+    def test_drift_is_reported_and_fails(self):
+        Item.objects.filter(pk=self.item.pk).update(downloads_count=5)
+
+        stdout = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "Found 1 incorrect counts"):
+            call_command("check_counts", format="json", stdout=stdout)
+
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report["mismatches"]["item"]["downloads_count"], 1)
+        self.assertEqual(report["mismatches"]["item"]["reviews_count"], 0)
+
+    def test_csv_lists_every_field(self):
+        Item.objects.filter(pk=self.item.pk).update(screenshots_count=2)
+
+        stdout = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("check_counts", format="csv", stdout=stdout)
+
+        rows = list(csv.reader(io.StringIO(stdout.getvalue())))
+        self.assertEqual(rows[0], ["model", "field", "mismatches"])
+        self.assertIn(["item", "screenshots_count", "1"], rows)
+        self.assertIn(["version", "downloads_count", "0"], rows)
+
+
+class RecalculateCountsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="Item", body="", user=self.user, permalink="item"
+        )
+        self.version = Version.objects.create(
+            item=self.item, name="1.0", link="https://example.com/"
+        )
+
+    def recalculate(self, *args):
+        call_command("recalculate_counts", *args, stdout=io.StringIO())
+
+    def backdate(self):
+        long_ago = timezone.now() - timedelta(days=1)
+        Item.objects.update(updated_at=long_ago)
+        Version.objects.update(updated_at=long_ago)
+
+    def drift(self):
+        # A count edited behind the model's back, on rows last saved long ago
+        Item.objects.filter(pk=self.item.pk).update(downloads_count=5)
+        self.backdate()
+
+    def downloads_count(self):
+        return Item.objects.get(pk=self.item.pk).downloads_count
+
+    def test_first_incremental_run_repairs_everything(self):
+        self.drift()
+        self.recalculate("--incremental")
+
+        self.assertEqual(self.downloads_count(), 0)
+        self.assertTrue(Watermark.objects.filter(name="recalculate_counts").exists())
+
+    def test_incremental_run_skips_untouched_rows(self):
+        self.recalculate("--incremental")
+        self.drift()
+        self.recalculate("--incremental")
+        self.assertEqual(self.downloads_count(), 5)
+
+        self.recalculate()
+        self.assertEqual(self.downloads_count(), 0)
+
+    def test_incremental_run_repairs_stale_rows(self):
+        self.recalculate("--incremental")
+        self.drift()
+        mark_stale("item", [self.item.pk])
+
+        self.recalculate("--incremental")
+
+        self.assertEqual(self.downloads_count(), 0)
+        self.assertFalse(StaleCount.objects.exists())
+
+    def test_bulk_delete_is_repaired(self):
+        Review.objects.create(
+            version=self.version, user=self.user, title="Good", body="", rating=5
+        )
+        self.recalculate("--incremental")
+        self.backdate()
+
+        # Queryset deletes skip Review.delete(), which keeps the count
+        Review.objects.all().delete()
+        self.assertEqual(Item.objects.get(pk=self.item.pk).reviews_count, 1)
+
+        self.recalculate("--incremental")
+        self.assertEqual(Item.objects.get(pk=self.item.pk).reviews_count, 0)
+
+
+class MergeTagsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        self.tags = {
+            name: Tag.objects.create(name=name) for name in ("solo", "foo", "baz")
+        }
+        self.first, self.second = [
+            Item.objects.create(name=name, body="", user=user, permalink=name)
+            for name in ("first", "second")
+        ]
+        self.first.tags.add(self.tags["solo"], self.tags["foo"])
+        self.second.tags.add(self.tags["foo"], self.tags["baz"])
+        recount_tags(Tag.objects.values("pk"))
+
+    def tag_names(self, item):
+        return set(item.tags.values_list("name", flat=True))
+
+    def test_merge(self):
+        impact = merge_tags(["solo", "foo"], "baz")
+
+        self.assertEqual(impact["added"], 1)
+        self.assertEqual(impact["removed"], 3)
+        self.assertEqual(self.tag_names(self.first), {"baz"})
+        self.assertEqual(self.tag_names(self.second), {"baz"})
+        self.assertEqual(dict(Tag.objects.values_list("name", "count")), {"baz": 2})
+
+    def test_merge_creates_target(self):
+        impact = merge_tags(["solo"], "new")
+
+        self.assertTrue(impact["created"])
+        self.assertEqual(self.tag_names(self.first), {"foo", "new"})
+        self.assertEqual(Tag.objects.get(name="new").count, 1)
+
+    def test_dry_run_changes_nothing(self):
+        impact = merge_tags(["solo", "foo"], "baz", dry_run=True)
+
+        self.assertEqual(impact["sources"], {"solo": 1, "foo": 2})
+        self.assertEqual(self.tag_names(self.first), {"solo", "foo"})
+        self.assertEqual(Tag.objects.get(name="baz").count, 1)
+
+    def test_unknown_source(self):
+        with self.assertRaisesMessage(CommandError, "Tags not found: nope"):
+            call_command("merge_tags", "nope", into="baz", stdout=io.StringIO())
+
+    def test_remove_tag_where_tagged(self):
+        self.assertEqual(remove_tag_where_tagged("foo", "baz"), 1)
+
+        self.assertEqual(self.tag_names(self.second), {"baz"})
+        self.assertEqual(self.tag_names(self.first), {"solo", "foo"})
+        self.assertEqual(Tag.objects.get(name="foo").count, 1)
+
+
+class SetItemTagsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="Item", body="", user=user, permalink="item"
+        )
+        self.solo, self.foo, self.bar = [
+            Tag.objects.create(name=name) for name in ("solo", "foo", "bar")
+        ]
+        set_item_tags(self.item, [self.solo], ["foo"])
+
+    def counts(self):
+        return dict(Tag.objects.values_list("name", "count"))
+
+    def test_replaces_tags_and_counts(self):
+        self.assertEqual(self.counts(), {"solo": 1, "foo": 1, "bar": 0})
+
+        set_item_tags(self.item, [self.bar], ["baz"])
+
+        self.assertEqual(
+            set(self.item.tags.values_list("name", flat=True)), {"bar", "baz"}
+        )
+        self.assertEqual(self.counts(), {"solo": 0, "foo": 0, "bar": 1, "baz": 1})
+
+    def test_unchanged_tags_write_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            set_item_tags(self.item, [self.solo], ["foo"])
+
+        writes = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(self.counts(), {"solo": 1, "foo": 1, "bar": 0})
+
+    def test_counts_never_go_negative(self):
+        Tag.objects.filter(name="solo").update(count=0)
+
+        set_item_tags(self.item, [], [])
+
+        self.assertEqual(self.counts(), {"solo": 0, "foo": 0, "bar": 0})
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="First", body="", user=user, permalink="first"
+        )
+        Version.objects.create(item=self.item, name="1.0", link="https://example.com/")
+
+    def test_cached_until_edited(self):
+        response = self.client.get("/items.rss")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"First", response.content)
+
+        with self.assertNumQueries(0):
+            again = self.client.get("/items.rss")
+        self.assertEqual(again.content, response.content)
+
+        self.item.name = "Renamed"
+        self.item.save()
+        self.assertIn(b"Renamed", self.client.get("/items.rss").content)
+
+    def test_conditional_requests(self):
+        response = self.client.get("/items.rss")
+
+        not_modified = self.client.get(
+            "/items.rss", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+        stale = self.client.get("/items.rss", HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale["ETag"], response["ETag"])
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.client.get("/tags/nope.rss").status_code, 404)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username="author")
+        self.item = Item.objects.create(
+            name="Item", body="Long text", user=user, permalink="item"
+        )
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_fields(self):
+        results = self.get("/api/items/", fields="id,name")["results"]
+        self.assertEqual(results, [{"id": self.item.pk, "name": "Item"}])
+
+    def test_lists_omit_large_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get("/api/items/")["results"]
+        self.assertNotIn("body", results[0])
+        self.assertFalse(any('"body"' in query["sql"] for query in queries))
+
+        detail = self.get(f"/api/items/{self.item.pk}/")
+        self.assertEqual(detail["body"], "Long text")
+
+        results = self.get("/api/items/", fields="id,body")["results"]
+        self.assertEqual(results[0]["body"], "Long text")
+
+    def test_omit(self):
+        detail = self.get(f"/api/items/{self.item.pk}/", omit="body,byline")
+        self.assertNotIn("body", detail)
+        self.assertNotIn("byline", detail)
+        self.assertEqual(detail["name"], "Item")
+
+    def test_unknown_field(self):
+        response = self.client.get("/api/items/", {"fields": "id,nope"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": ["Unknown fields: nope"]})
+
+
+class ExpandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="author")
+        self.tag = Tag.objects.create(name="solo")
+        self.add_items(2)
+
+    def add_items(self, count):
+        start = Item.objects.count()
+        for i in range(start, start + count):
+            item = Item.objects.create(
+                name=f"Item {i}", body="", user=self.user, permalink=f"item-{i}"
+            )
+            item.tags.add(self.tag)
+            Version.objects.create(item=item, name="1.0", link="https://example.com/")
+
+    def get_items(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/items/", {"expand": "user,tags,versions"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"], len(queries)
+
+    def test_expand(self):
+        results, _ = self.get_items()
+
+        self.assertEqual(results[0]["user"]["username"], "author")
+        self.assertEqual(results[0]["tags"][0]["name"], "solo")
+        self.assertEqual(results[0]["versions"][0]["name"], "1.0")
+
+    def test_queries_do_not_grow_with_items(self):
+        _, queries = self.get_items()
+        self.add_items(3)
+        results, more_queries = self.get_items()
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(more_queries, queries)
+
+    def test_unknown_relation(self):
+        response = self.client.get("/api/items/", {"expand": "user,nope"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"expand": ["Unknown fields: nope"]})
+
+
+class ItemFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username="author")
+        other = User.objects.create(username="other")
+        published = timezone.now()
+        self.solo = Tag.objects.create(name="solo")
+        self.loud, self.quiet = [
+            Item.objects.create(
+                name=name,
+                body="",
+                user=user,
+                permalink=name,
+                version_created_at=published,
+                downloads_count=downloads,
+            )
+            for name, user, downloads in [("loud", other, 9), ("quiet", author, 1)]
+        ]
+        self.quiet.tags.add(self.solo)
+
+    def names(self, **params):
+        response = self.client.get("/api/items/", params)
+        self.assertEqual(response.status_code, 200)
+        return [item["name"] for item in response.json()["results"]]
+
+    def test_filters(self):
+        self.assertEqual(self.names(tag="solo"), ["quiet"])
+        self.assertEqual(self.names(user="other"), ["loud"])
+        self.assertEqual(self.names(tag="solo", user="other"), [])
+
+    def test_unknown_filter_value(self):
+        self.assertEqual(self.names(tag="nope"), [])
+        self.assertEqual(self.names(user="nobody"), [])
+
+    def test_order(self):
+        self.assertEqual(self.names(order="popular"), ["loud", "quiet"])
+        # Newest first without an order
+        self.assertEqual(self.names(), ["quiet", "loud"])
+
+    def test_unknown_order(self):
+        response = self.client.get("/api/items/", {"order": "random"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("order", response.json())
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username="author")
+        self.first, self.second = [
+            Item.objects.create(name=name, body="", user=user, permalink=name)
+            for name in ("first", "second")
+        ]
+
+    def batch(self, method="get", **data):
+        response = getattr(self.client, method)("/api/items/batch/", data)
+        return response.status_code, response.json()
+
+    def post_json(self, data):
+        response = self.client.post(
+            "/api/items/batch/?fields=id", data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ids_in_requested_order(self):
+        status, data = self.batch(ids=f"{self.second.pk},{self.first.pk},999")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [item["name"] for item in data["results"]], ["second", "first"]
+        )
+        self.assertEqual(data["missing"], ["999"])
+
+    def test_posted_keys(self):
+        data = self.post_json({"permalinks": ["first", "first", "nope"]})
+        self.assertEqual(data["results"], [{"id": self.first.pk}])
+        self.assertEqual(data["missing"], ["nope"])
+
+        data = self.post_json({"ids": [self.second.pk]})
+        self.assertEqual(data["results"], [{"id": self.second.pk}])
+
+        # Repeated form fields
+        status, data = self.batch("post", permalinks=["first", "second"])
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [item["name"] for item in data["results"]], ["first", "second"]
+        )
+
+    def test_fields_without_key_column(self):
+        status, data = self.batch(permalinks="first", fields="name")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data["results"], [{"name": "first"}])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.batch()[0], 400)
+        self.assertEqual(self.batch(ids="1", permalinks="first")[0], 400)
+        self.assertEqual(self.batch(ids="1,two")[0], 400)
+
+        with self.settings(API_MAX_BATCH_SIZE=1):
+            status, data = self.batch(ids="1,2")
+        self.assertEqual(status, 400)
+        self.assertEqual(data, ["At most 1 items can be fetched at once."])
+
+
+class ValuesListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username="author")
+        item = Item.objects.create(name="Item", body="", user=user, permalink="item")
+        version = Version.objects.create(
+            item=item, name="1.0", link="https://example.com/"
+        )
+        for rating in (2, 5):
+            Review.objects.create(
+                version=version, user=user, title="Review", body="", rating=rating
+            )
+        Download.objects.create(version=version, user=None)
+        Download.objects.create(version=version, user=user)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_serializers(self):
+        for url, viewset in [
+            ("/api/reviews/", ReviewViewSet),
+            ("/api/downloads/", DownloadViewSet),
+        ]:
+            fast = self.get(url)
+            with mock.patch.object(viewset, "values_list_enabled", False):
+                self.assertEqual(fast, self.get(url), url)
+
+    def test_fields(self):
+        results = self.get("/api/reviews/", fields="rating")["results"]
+        self.assertEqual(results, [{"rating": 5}, {"rating": 2}])
+
+    def test_unknown_field(self):
+        response = self.client.get("/api/reviews/", {"fields": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username="author")
+        self.items = [
+            Item.objects.create(name=name, body="", user=user, permalink=name)
+            for name in ("first", "second")
+        ]
+        version = Version.objects.create(
+            item=self.items[0], name="1.0", link="https://example.com/"
+        )
+        Review.objects.create(
+            version=version, user=user, title="Good", body="", rating=5
+        )
+        self.items[0].tags.add(Tag.objects.create(name="solo"))
+
+    def export(self, **headers):
+        response = self.client.get("/api/export.ndjson", **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_items_in_id_order(self):
+        response, content = self.export()
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([line["id"] for line in lines], [i.pk for i in self.items])
+        self.assertEqual(lines[0]["tags"][0]["name"], "solo")
+        self.assertEqual(lines[0]["versions"][0]["reviews"][0]["title"], "Good")
+        self.assertEqual(lines[1]["versions"], [])
+
+    def test_resume_after(self):
+        response = self.client.get("/api/export.ndjson", {"after": self.items[0].pk})
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [self.items[1].pk])
+
+    def test_gzip(self):
+        _, content = self.export()
+        response, gzipped = self.export(HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(gzipped), content)
+
+    def test_bad_after(self):
+        response = self.client.get("/api/export.ndjson", {"after": "-1"})
+        self.assertEqual(response.status_code, 400)
+
+
+class GetViewNameTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_uses_existing_match(self):
+        request = self.factory.get("/tags/")
+        request.resolver_match = resolve("/items.rss")
+
+        with mock.patch("items.utils.resolve") as resolve_mock:
+            self.assertEqual(get_view_name(request), request.resolver_match.view_name)
+        resolve_mock.assert_not_called()
+
+    def test_resolves_once(self):
+        request = self.factory.get("/tags/")
+
+        with mock.patch("items.utils.resolve", wraps=resolve) as resolve_mock:
+            self.assertEqual(get_view_name(request), "tags")
+            self.assertEqual(get_view_name(request), "tags")
+        resolve_mock.assert_called_once_with("/tags/")
+
+    def test_unresolved_path(self):
+        request = self.factory.get("/no/such/page")
+
+        with mock.patch("items.utils.resolve", wraps=resolve) as resolve_mock:
+            self.assertIsNone(get_view_name(request))
+            self.assertIsNone(get_view_name(request))
+        resolve_mock.assert_called_once()
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        self.member = User.objects.create(username="member")
+
+    def test_header_for_staff_only(self):
+        self.assertNotIn("Server-Timing", self.client.get("/api/tags/"))
+
+        self.client.force_login(self.member)
+        self.assertNotIn("Server-Timing", self.client.get("/api/tags/"))
+
+        self.client.force_login(self.staff)
+        header = self.client.get("/api/tags/")["Server-Timing"]
+        self.assertRegex(header, r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=')
+        self.assertIn("total;dur=", header)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_logged(self):
+        with self.assertLogs("s7.timing") as logs:
+            self.client.get("/api/tags/")
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["view"], "tag-list")
+        self.assertEqual(line["status"], 200)
+        self.assertGreater(line["db_queries"], 0)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0, SERVER_TIMING_SLOW_MS=60000)
+    def test_fast_unsampled_requests_are_not_logged(self):
+        with self.assertNoLogs("s7.timing"):
+            self.client.get("/api/tags/")
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_streamed_body_is_timed(self):
+        Item.objects.create(name="Item", body="", user=self.staff, permalink="item")
+        self.client.force_login(self.staff)
+
+        with self.assertLogs("s7.timing") as logs:
+            response = self.client.get("/api/export.ndjson")
+            self.assertNotIn("Server-Timing", response)
+            self.assertEqual(logs.records, [])
+            b"".join(response.streaming_content)
+
+        # The export's own queries run while the body streams
+        line = json.loads(logs.records[0].getMessage())
+        self.assertGreaterEqual(line["db_queries"], 5)
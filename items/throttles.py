@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.http import HttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Keeps throttling per process when the shared cache is unreachable
+local_cache = LocMemCache("throttles", {"OPTIONS": {"MAX_ENTRIES": 10000}})
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """
+    Turns "<tokens>/<period>" into (capacity, seconds). The bucket holds that
+    many tokens and refills completely over the period.
+    """
+    if rate is None:
+        return None
+    tokens, period = rate.split("/")
+    return int(tokens), PERIODS[period[0]]
+
+
+# Buckets are kept as the generic cell rate algorithm's theoretical arrival
+# time: the moment the bucket will be full again. Spending a token pushes it
+# one interval later, and a request is refused if that would put it more than
+# a period past now. Redis runs the whole step as one script, on its own clock.
+GCRA_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = math.max(tonumber(redis.call("GET", KEYS[1]) or 0), now) + interval
+if tat - now > period then
+    return tostring(tat - now - period)
+end
+redis.call("SET", KEYS[1], tostring(tat), "PX", math.ceil((tat - now) * 1000))
+return "0"
+"""
+
+# Other caches are only shared within a process, so a lock makes them atomic
+local_lock = threading.Lock()
+
+
+def take_token_locally(store, key, interval, period):
+    with local_lock:
+        now = time.time()
+        tat = max(store.get(key, 0), now) + interval
+        if tat - now > period:
+            return tat - now - period
+
+        store.set(key, tat, math.ceil(tat - now))
+        return 0
+
+
+def take_token(key, rate):
+    """
+    Takes a token from the bucket stored under key. Returns 0 if one was
+    available, otherwise the seconds until the next one is.
+    """
+    capacity, period = rate
+    interval = period / capacity
+
+    backend = caches["default"]
+    try:
+        if isinstance(backend, RedisCache):
+            client = backend._cache.get_client(key, write=True)
+            wait = client.eval(
+                GCRA_SCRIPT, 1, backend.make_and_validate_key(key), interval, period
+            )
+            return float(wait)
+        return take_token_locally(backend, key, interval, period)
+    except Exception:
+        return take_token_locally(local_cache, key, interval, period)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket throttle with its rate taken from DEFAULT_THROTTLE_RATES
+    under scope. A scope set to None is not throttled.
+    """
+
+    scope = None
+
+    def __init__(self, scope=None):
+        if scope is not None:
+            self.scope = scope
+        self.rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(self.scope))
+        self.retry_after = None
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            return f"throttle:{self.scope}:user:{request.user.pk}"
+        return f"throttle:{self.scope}:ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        self.retry_after = take_token(key, self.rate)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonBucketThrottle(TokenBucketThrottle):
+    scope = "anon"
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            return None
+        return super().get_cache_key(request, view)
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    scope = "user"
+
+    def get_cache_key(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        return super().get_cache_key(request, view)
+
+
+def throttle(scope):
+    """
+    Throttles a plain view per user, or per IP for anonymous requests,
+    answering 429 with Retry-After once the bucket for scope is empty.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            bucket = TokenBucketThrottle(scope)
+            if not bucket.allow_request(request, None):
+                response = HttpResponse("Too many requests", status=429)
+                response["Retry-After"] = str(math.ceil(bucket.wait()))
+                return response
+
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
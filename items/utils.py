@@ -15,11 +15,14 @@ from django.db.models import (
     Case,
 )
 from django.db.models.functions import Length
+from django.urls import Resolver404, resolve
 
 from .models import Item, Version, Screenshot
 
 PAGE_SIZE = 20
 
+ORDER_VALUES = ["old", "reviews", "best", "worst", "loud", "popular", "random"]
+
 
 def order_items(items, order):
     if order == "old":
@@ -54,11 +57,7 @@ def order_items(items, order):
     return items
 
 
-def get_filtered_items(
-    request=None, items=None, tc=None, tag=None, user=None, scenarios=False
-):
-    items = items or Item.objects.exclude(version_created_at__isnull=True)
-
+def filter_items(items, tc=None, tag=None, user=None, search=None, order=None):
     if tc:
         items = items.filter(tc=tc)
 
@@ -68,6 +67,38 @@ def get_filtered_items(
     if user:
         items = items.filter(user=user)
 
+    if search:
+        vector = (
+            SearchVector("name", weight="A")
+            + SearchVector("byline", weight="A")
+            + SearchVector("tags_names", weight="D")
+            + SearchVector("body", weight="D")
+        )
+        query = SearchQuery(search)
+
+        items = (
+            items.annotate(
+                tags_names=ArrayAgg(
+                    "tags__name",
+                    distinct=True,
+                )
+            )
+            .annotate(rank=SearchRank(vector, query))
+            .filter(rank__gte=0.02)
+            .order_by("-rank", "-version_created_at")
+            .distinct()
+        )
+    else:
+        items = order_items(items, order)
+
+    return items
+
+
+def get_filtered_items(
+    request=None, items=None, tc=None, tag=None, user=None, scenarios=False
+):
+    items = items or Item.objects.exclude(version_created_at__isnull=True)
+
     MAX_DESCRIPTION_LENGTH = 2000
 
     items = items.annotate(
@@ -97,29 +128,7 @@ def get_filtered_items(
     search = request.GET.get("search", None) if request else None
     page_number = request.GET.get("page") if request else None
 
-    if search:
-        vector = (
-            SearchVector("name", weight="A")
-            + SearchVector("byline", weight="A")
-            + SearchVector("tags_names", weight="D")
-            + SearchVector("body", weight="D")
-        )
-        query = SearchQuery(search)
-
-        items = (
-            items.annotate(
-                tags_names=ArrayAgg(
-                    "tags__name",
-                    distinct=True,
-                )
-            )
-            .annotate(rank=SearchRank(vector, query))
-            .filter(rank__gte=0.02)
-            .order_by("-rank", "-version_created_at")
-            .distinct()
-        )
-    else:
-        items = order_items(items, order)
+    items = filter_items(items, tc=tc, tag=tag, user=user, search=search, order=order)
 
     if request:
         items = items.annotate(user_has_permission=Q(user_id=request.user.id))
@@ -147,3 +156,18 @@ def page_out_of_bounds(request, page_obj):
         else:
             return page_obj.number != page_number
     return False
+
+
+def get_view_name(request):
+    """
+    Returns the name of the view the request resolved to, or None if it
+    resolved to nothing. Requests that went through URL resolution already
+    carry their match; the rest, such as 404s, are resolved here once.
+    """
+    if request.resolver_match is None and not getattr(request, "unresolved", False):
+        try:
+            request.resolver_match = resolve(request.path_info)
+        except Resolver404:
+            request.unresolved = True
+
+    return request.resolver_match and request.resolver_match.view_name
@@ -1,10 +1,26 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F, Prefetch
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.urls import path, include
-from rest_framework import viewsets, permissions
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, permissions, renderers, serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.routers import DefaultRouter
+from rest_framework.settings import api_settings
 
-from ..models import Item, Version, Download, Review, Screenshot, Tag
+from ..changes import TRACKED_MODELS
+from ..export import export_lines, gzip_lines
+from ..models import Change, Item, Version, Download, Review, Screenshot, Tag
 from ..permissions import IsOwnerOrReadOnly
+from ..renderers import FastJSONRenderer
+from ..utils import ORDER_VALUES, filter_items
+from ..throttles import throttle
 from ..serializers import (
+    ChangeSerializer,
     ItemSerializer,
     VersionSerializer,
     DownloadSerializer,
@@ -13,43 +29,416 @@ from ..serializers import (
     TagSerializer,
 )
 
+User = get_user_model()
 
-class ItemViewSet(viewsets.ModelViewSet):
+
+class SparseFieldsetMixin:
+    """
+    Lets clients choose fields with ?fields= and drop them with ?omit=. Only
+    the columns behind the chosen fields are loaded.
+    """
+
+    # Left out of lists unless named in ?fields=
+    list_omit = []
+
+    # Actions that only read, even when the request is a POST
+    read_actions = []
+
+    def get_query_list(self, param):
+        return [
+            name
+            for value in self.request.query_params.getlist(param)
+            for name in value.split(",")
+            if name
+        ]
+
+    @cached_property
+    def requested_fields(self):
+        return self.get_requested_fields()
+
+    def get_requested_fields(self):
+        if (
+            self.request.method not in permissions.SAFE_METHODS
+            and self.action not in self.read_actions
+        ):
+            return None
+
+        available = list(self.get_serializer_class()().fields)
+        fields = self.get_query_list("fields")
+        omit = self.get_query_list("omit")
+
+        unknown = [name for name in fields + omit if name not in available]
+        if unknown:
+            raise ValidationError({"fields": [f"Unknown fields: {', '.join(unknown)}"]})
+
+        if not fields and self.action == "list":
+            omit += self.list_omit
+
+        if not fields and not omit:
+            return None
+
+        return [name for name in fields or available if name not in omit]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.requested_fields is not None:
+            meta = queryset.model._meta
+            columns = {field.name for field in meta.concrete_fields}
+            queryset = queryset.only(
+                meta.pk.name,
+                *(name for name in self.requested_fields if name in columns),
+            )
+
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.requested_fields is not None:
+            kwargs.setdefault("fields", self.requested_fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ValuesListMixin:
+    """
+    Serves lists from values() rows instead of serializing model instances,
+    for flat models whose serialized fields are just their columns.
+    Non-trivial fields still go through the serializer field's
+    to_representation, so output matches the regular path.
+    """
+
+    renderer_classes = [FastJSONRenderer, renderers.BrowsableAPIRenderer]
+
+    # Cleared by the benchmark to compare against the regular path
+    values_list_enabled = True
+
+    # Fields whose value is already what the serializer would output
+    passthrough_fields = (
+        serializers.BooleanField,
+        serializers.CharField,
+        serializers.FloatField,
+        serializers.IntegerField,
+        serializers.PrimaryKeyRelatedField,
+    )
+
+    def get_representation(self, field):
+        if not isinstance(field, serializers.DateTimeField):
+            return field.to_representation
+
+        # DateTimeField.to_representation looks the timezone up for every
+        # value; this does the same conversion with it looked up once.
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        tz = getattr(field, "timezone", None) or field.default_timezone()
+        if tz is None or output_format is None or output_format.lower() != ISO_8601:
+            return field.to_representation
+
+        def to_representation(value):
+            value = value.astimezone(tz).isoformat()
+            if value.endswith("+00:00"):
+                value = value[:-6] + "Z"
+            return value
+
+        return to_representation
+
+    def list(self, request, *args, **kwargs):
+        if not self.values_list_enabled:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.query.order_by:
+            # Paged by id, as values() rows have no pk key for the cursor
+            queryset = queryset.order_by("-id")
+
+        serializer_fields = self.get_serializer().fields
+        names = list(serializer_fields)
+        converters = [
+            (name, self.get_representation(field))
+            for name, field in serializer_fields.items()
+            if not isinstance(field, self.passthrough_fields)
+        ]
+
+        rows = self.paginate_queryset(queryset.values(*dict.fromkeys(["id", *names])))
+        data = []
+        for row in rows:
+            for name, to_representation in converters:
+                if row[name] is not None:
+                    row[name] = to_representation(row[name])
+            data.append({name: row[name] for name in names})
+
+        return self.get_paginated_response(data)
+
+
+class ItemViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
+    list_omit = ["body"]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
+    # Relations ?expand= can embed that are prefetched rather than joined
+    prefetched = {
+        "versions": Version.objects.order_by("-created_at"),
+        "screenshots": Screenshot.objects.all(),
+        "tags": Tag.objects.all(),
+    }
+
+    read_actions = ["batch"]
+
+    # Pages need a stable order, which a random one is not
+    orders = [order for order in ORDER_VALUES if order != "random"]
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != "list":
+            return queryset
+
+        params = self.request.query_params
+        order = params.get("order")
+        search = params.get("search")
+        if order is not None and order not in self.orders:
+            raise ValidationError(
+                {"order": [f"Must be one of {', '.join(self.orders)}."]}
+            )
+
+        lookups = {
+            "tag": lambda name: Tag.objects.filter(name=name).order_by("pk").first(),
+            "tc": lambda permalink: Item.objects.filter(permalink=permalink).first(),
+            "user": lambda username: User.objects.filter(username=username).first(),
+        }
+        filters = {}
+        for param, lookup in lookups.items():
+            if param in params:
+                filters[param] = lookup(params[param])
+                if filters[param] is None:
+                    return queryset.none()
 
-class VersionViewSet(viewsets.ModelViewSet):
+        if order or search:
+            # Ordered like the HTML listings, which only show published items
+            queryset = queryset.exclude(version_created_at__isnull=True)
+            return filter_items(queryset, search=search, order=order, **filters)
+
+        # Without an order, pages keep to the primary key
+        return filter_items(queryset, **filters).order_by()
+
+    @cached_property
+    def expand(self):
+        expand = self.get_query_list("expand")
+
+        unknown = [
+            name for name in expand if name not in ItemSerializer.Meta.expandable
+        ]
+        if unknown:
+            raise ValidationError({"expand": [f"Unknown fields: {', '.join(unknown)}"]})
+
+        return list(dict.fromkeys(expand))
+
+    def get_requested_fields(self):
+        fields = super().get_requested_fields()
+        if fields is None:
+            return None
+
+        # Expanded relations are needed even when ?fields= leaves them out
+        return fields + [name for name in self.expand if name not in fields]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if "user" in self.expand:
+            queryset = queryset.select_related("user")
+
+        # Tag ids are listed from the prefetch too, rather than once per item
+        fields = self.requested_fields
+        prefetch = set(self.expand)
+        if fields is None or "tags" in fields:
+            prefetch.add("tags")
+
+        return queryset.prefetch_related(
+            *(
+                Prefetch(name, queryset=queryset)
+                for name, queryset in self.prefetched.items()
+                if name in prefetch
+            )
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("expand", self.expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_batch_keys(self, param):
+        if self.request.method != "POST":
+            return self.get_query_list(param)
+
+        # A JSON list or comma separated string, or repeated form fields
+        data = self.request.data
+        values = (
+            data.getlist(param) if hasattr(data, "getlist") else data.get(param, [])
+        )
+        if isinstance(values, (str, int)):
+            values = [values]
+        return [key for value in values for key in str(value).split(",") if key]
+
+    @action(
+        detail=False,
+        methods=["get", "post"],
+        permission_classes=[permissions.AllowAny],
+    )
+    def batch(self, request):
+        """
+        Returns the items named by ?ids= or ?permalinks=, or by the same keys
+        in a POST body, in the order they were asked for. Keys that match no
+        item are listed under missing.
+        """
+        ids = self.get_batch_keys("ids")
+        permalinks = self.get_batch_keys("permalinks")
+        if bool(ids) == bool(permalinks):
+            raise ValidationError(["Pass either ids or permalinks."])
+
+        field, keys = ("pk", ids) if ids else ("permalink", permalinks)
+        keys = list(dict.fromkeys(keys))
+
+        if len(keys) > settings.API_MAX_BATCH_SIZE:
+            raise ValidationError(
+                [f"At most {settings.API_MAX_BATCH_SIZE} items can be fetched at once."]
+            )
+        if field == "pk" and not all(key.isdigit() for key in keys):
+            raise ValidationError({"ids": ["Must be numbers."]})
+
+        # Annotated, as ?fields= may have left the key column out
+        items = self.get_queryset().filter(**{f"{field}__in": keys})
+        found = {
+            str(item.batch_key): item for item in items.annotate(batch_key=F(field))
+        }
+
+        serializer = self.get_serializer(
+            [found[key] for key in keys if key in found], many=True
+        )
+        return Response(
+            {
+                "results": serializer.data,
+                "missing": [key for key in keys if key not in found],
+            }
+        )
+
+
+class VersionViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Version.objects.all()
     serializer_class = VersionSerializer
+    list_omit = ["body"]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
 
-class DownloadViewSet(viewsets.ModelViewSet):
+class DownloadViewSet(ValuesListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Download.objects.all()
     serializer_class = DownloadSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ValuesListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    list_omit = ["body"]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
 
-class ScreenshotViewSet(viewsets.ModelViewSet):
+class ScreenshotViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Screenshot.objects.all()
     serializer_class = ScreenshotSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
 
+class ChangeViewSet(viewsets.GenericViewSet):
+    """
+    Lists changes to items, versions, screenshots and reviews in the order
+    they were committed. Pass the last id seen as ?since= to get the next
+    changes; deleted objects are listed with a null object.
+
+    Counts, ratings and version_created_at are kept up to date from the
+    versions, reviews, screenshots and downloads below an object, and change
+    without a change of their own: refresh an item or version whenever one
+    below it changes. Downloads are not listed at all.
+    """
+
+    queryset = Change.objects.order_by("pk")
+    serializer_class = ChangeSerializer
+    pagination_class = None
+
+    object_serializers = {
+        "item": ItemSerializer,
+        "version": VersionSerializer,
+        "screenshot": ScreenshotSerializer,
+        "review": ReviewSerializer,
+    }
+
+    def list(self, request):
+        since = request.query_params.get("since", "0")
+        page_size = request.query_params.get("page_size", str(api_settings.PAGE_SIZE))
+        if not since.isdigit():
+            raise ValidationError({"since": ["Must be the id of a change."]})
+        if not page_size.isdigit():
+            raise ValidationError({"page_size": ["Must be a number."]})
+
+        page_size = min(int(page_size), settings.API_MAX_PAGE_SIZE) or 1
+        changes = list(self.get_queryset().filter(pk__gt=since)[: page_size + 1])
+        has_more = len(changes) > page_size
+        changes = changes[:page_size]
+
+        # One query per model for the current state of everything changed
+        objects = {}
+        for model, Model in TRACKED_MODELS.items():
+            object_ids = {
+                change.object_id for change in changes if change.model == model
+            }
+            if not object_ids:
+                continue
+
+            queryset = Model.objects.filter(pk__in=object_ids)
+            if Model is Item:
+                queryset = queryset.prefetch_related("tags")
+
+            for data in self.object_serializers[model](queryset, many=True).data:
+                objects[(model, data["id"])] = data
+
+        serializer = self.get_serializer(
+            changes,
+            many=True,
+            context={**self.get_serializer_context(), "objects": objects},
+        )
+
+        return Response(
+            {
+                "next": changes[-1].pk if changes else int(since),
+                "has_more": has_more,
+                "results": serializer.data,
+            }
+        )
+
+
+@throttle("export")
+def export(request):
+    """
+    Streams the whole catalog as NDJSON, one item per line. Pass the id of
+    the last item received as ?after= to resume an interrupted download.
+    """
+    after = request.GET.get("after", "0")
+    if not after.isdigit():
+        return HttpResponseBadRequest("after must be the id of an item")
+
+    lines = export_lines(int(after))
+    gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+    if gzipped:
+        lines = gzip_lines(lines)
+
+    response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+    if gzipped:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
 router = DefaultRouter()
 router.register(r"items", ItemViewSet)
 router.register(r"versions", VersionViewSet)
@@ -57,4 +446,8 @@ router.register(r"downloads", DownloadViewSet)
 router.register(r"reviews", ReviewViewSet)
 router.register(r"screenshots", ScreenshotViewSet)
 router.register(r"tags", TagViewSet)
-api_paths = [path("api/", include(router.urls))]
+router.register(r"changes", ChangeViewSet)
+api_paths = [
+    path("api/export.ndjson", export, name="export"),
+    path("api/", include(router.urls)),
+]
@@ -24,6 +24,7 @@ from ..models import Item, Version, Download, Review, Screenshot, Tag
 from django.contrib.auth import get_user_model
 from django.contrib import messages
 
+from ..throttles import throttle
 from ..utils import (
     get_filtered_items,
     PAGE_SIZE,
@@ -561,6 +562,7 @@ item_paths += [
 ]
 
 
+@throttle("download")
 def download_create(request, item_permalink):
     item = get_object_or_404(Item, permalink=item_permalink)
     version = Version.objects.filter(item=item).order_by("-created_at").first()
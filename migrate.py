@@ -1,16 +1,26 @@
+import argparse
+import io
+import json
+import multiprocessing
 import os
 import re
 
 import django
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
 
-from django.db import connections
+from django.db import connection, connections
+from django.db.models import Max
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "s7.settings")
 django.setup()
 
 import sqlite3
 from items.models import Item, Version, Download, Review, Screenshot, Tag, User
+from items.tags import ItemTag, recount_tags
+from convert.convert import INSERT_HEADER, ROW, SKIPPED_LINE, STATEMENT_END, parse_row
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from contextlib import contextmanager
@@ -80,15 +90,27 @@ def suppress_auto_now(model, field_names):
 
 User = get_user_model()
 
-# Open a connection to your SQLite database
-conn = sqlite3.connect("s7.db")
+LEGACY_DATABASE = "s7.db"
 
-# Initialize a dictionary to track username frequencies
+# Statements that drop and restore the constraints and indexes deferred for a
+# load, kept on disk until they have run so an interrupted import can still
+# restore them
+DEFERRED_CONSTRAINTS_FILE = "s7.db.constraints.json"
+
+CREATE_TABLE = re.compile(r"CREATE TABLE `?(\w+)`?")
+COLUMN = re.compile(r"^\s+`(\w+)`", re.MULTILINE)
+
+# Rows are read, transformed and saved this many at a time, so memory use is
+# bounded by the batch size rather than the table size.
+BATCH_SIZE = 5000
+
+# Initialize a dictionary to track username frequencies. This one is kept
+# for the whole import, as any later user may reuse an earlier username.
 username_counts = {}
 
 tables = [
     ("tags", Tag),
-    ("taggings", None),
+    ("taggings", ItemTag),
     ("users", User),
     ("items", Item),
     ("versions", Version),
@@ -97,22 +119,26 @@ tables = [
     ("screenshots", Screenshot),
 ]
 
-taggings_dict = {}
-version_ids = set()
-item_ids = set()
-item_created_at = {}
-user_ids = set()
-
-# Clear all tables
-for table, Model in tables[::-1]:
-    if table == "items":
-        Model.objects.update(tc=None)
+# Tables in a group only depend on tables in earlier groups, so each group
+# can be loaded in parallel once the groups before it are done.
+table_groups = [
+    ["tags", "users"],
+    ["items"],
+    ["versions", "taggings"],
+    ["downloads", "reviews", "screenshots"],
+]
 
-    if Model is None:
-        continue
+# Columns that must refer to a row imported from an earlier group. Rather than
+# keeping every id in memory, each batch looks up the ids it refers to.
+REFERENCES = {
+    "taggings": {"taggable_id": Item, "tag_id": Tag},
+    "downloads": {"version_id": Version, "user_id": User},
+    "reviews": {"version_id": Version},
+    "screenshots": {"item_id": Item},
+}
 
-    print(f"Deleting all {table} rows...")
-    Model.objects.all().delete()
+# Why rows were skipped or changed, per table, reported after each table
+notes = Counter()
 
 
 def clean_date(dt):
@@ -126,216 +152,637 @@ def clean_date(dt):
     return timezone.make_aware(dt_obj)
 
 
-# For each table in your SQLite database...
-for table, Model in tables:
+def read_rows(conn, table, after_id=0):
+    # Reading in id order lets an interrupted import pick up where it stopped
     cursor = conn.cursor()
-    cursor.execute(f"SELECT * FROM {table}")
+    cursor.execute(f"SELECT * FROM {table} WHERE id > ? ORDER BY id", [after_id])
 
     column_names = [column[0] for column in cursor.description]
 
-    instances = []  # Collect all instances for bulk creation
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
 
-    for row in cursor.fetchall():
-        row_dict = dict(zip(column_names, row))
+        for row in rows:
+            yield dict(zip(column_names, row))
 
-        if table == "taggings":
-            item_id = row_dict["taggable_id"]
-            tag_id = row_dict["tag_id"]
 
-            # Add item-tag relationship to dictionary
-            if item_id in taggings_dict:
-                taggings_dict[item_id].append(tag_id)
-            else:
-                taggings_dict[item_id] = [tag_id]
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
-            continue
 
-        if "tc_id" in row_dict and row_dict["tc_id"] == 0:
-            row_dict["tc_id"] = None
+def dedupe_username(username):
+    # If the username has been seen before, append a suffix to it
+    count = username_counts.get(username, 0)
+    if count > 0:
+        username = f"{username}_{count}"
+    username_counts[username] = count + 1
+    return username
 
-        if table == "versions":
-            if "body" in row_dict and row_dict["body"] is None:
-                row_dict["body"] = ""
 
-        if table == "downloads":
-            row_dict.pop("item_id")
+def last_imported_id(table):
+    """
+    Legacy ids are kept, so the highest id already in a table is the
+    checkpoint of the last batch that was committed to it.
+    """
+    if table == "taggings":
+        # Item-tag pairs get new ids, so they are all read again and the
+        # pairs already saved are skipped
+        return 0
+    return dict(tables)[table].objects.aggregate(last_id=Max("id"))["last_id"] or 0
 
-            # if version doesn't exist, skip the row
-            version_id = row_dict.get("version_id")
-            if version_id is None or version_id not in version_ids:
-                continue
 
-            # if user doesn't exist, nullify
-            user_id = row_dict.get("user_id")
-            if user_id is not None and user_id not in user_ids:
-                print(f"Nullifying download for user_id {user_id}")
-                row_dict["user_id"] = None
-
-        if table == "users":
-            # Map the fields
-            created_at = clean_date(row_dict.pop("created_at", None))
-
-            # If date_joined is not None, make it timezone-aware
-            if created_at is not None:
-                row_dict["date_joined"] = created_at
-
-            row_dict["is_staff"] = row_dict.pop("admin", None) == 1
-            row_dict["is_superuser"] = row_dict["is_staff"]
-            row_dict["first_name"] = row_dict.pop("login", None)
-
-            # If the username has been seen before, append a suffix to it
-            username = row_dict.pop("permalink", None)
-            count = username_counts.get(username, 0)
-            if count > 0:
-                username = f"{username}_{count}"
-            username_counts[username] = count + 1
-            row_dict["username"] = username
-
-            # Remove unnecessary fields
-            unnecessary_fields = [
-                "crypted_password",
-                "salt",
-                "updated_at",
-                "remember_token",
-                "remember_token_expires_at",
-            ]
-            for field in unnecessary_fields:
-                row_dict.pop(field, None)
-
-        if table == "reviews":
-            # Remove unnecessary fields
-            unnecessary_fields = [
-                "item_id",
-                "relevancy",
+def load_references(table, row_dicts):
+    """
+    Looks up what a batch of legacy rows refers to: which of the referenced
+    ids exist, the created_at of the items of undated rows and, for
+    taggings, the pairs already saved.
+    """
+    refs = {}
+    for column, Model in REFERENCES.get(table, {}).items():
+        ids = {row_dict[column] for row_dict in row_dicts} - {None}
+        refs[column] = set(
+            Model.objects.filter(pk__in=ids).values_list("pk", flat=True)
+        )
+
+    undated = {
+        row_dict.get("item_id")
+        for row_dict in row_dicts
+        if row_dict.get("created_at") is None and row_dict.get("updated_at") is None
+    } - {None}
+    refs["item_created_at"] = dict(
+        Item.objects.filter(pk__in=undated).values_list("pk", "created_at")
+        if undated
+        else []
+    )
+
+    if table == "taggings":
+        refs["taggings"] = set(
+            ItemTag.objects.filter(item__in=refs["taggable_id"]).values_list(
+                "item_id", "tag_id"
+            )
+        )
+
+    return refs
+
+
+def transform_row(table, row_dict, refs):
+    """
+    Converts a legacy row into keyword arguments for the matching model, or
+    returns None if the row should be skipped. refs comes from
+    load_references() for the row's batch.
+    """
+    if table == "taggings":
+        pair = (row_dict["taggable_id"], row_dict["tag_id"])
+        if pair[0] not in refs["taggable_id"]:
+            notes["skipped, item missing"] += 1
+            return None
+        if pair[1] not in refs["tag_id"]:
+            notes["skipped, tag missing"] += 1
+            return None
+
+        # Pairs are tagged more than once in the legacy data
+        if pair in refs["taggings"]:
+            return None
+        refs["taggings"].add(pair)
+
+        return {"item_id": pair[0], "tag_id": pair[1]}
+
+    if "tc_id" in row_dict and row_dict["tc_id"] == 0:
+        row_dict["tc_id"] = None
+
+    if table == "versions":
+        if "body" in row_dict and row_dict["body"] is None:
+            row_dict["body"] = ""
+
+    if table == "downloads":
+        row_dict.pop("item_id")
+
+        # if version doesn't exist, skip the row
+        version_id = row_dict.get("version_id")
+        if version_id is None or version_id not in refs["version_id"]:
+            notes["skipped, version missing"] += 1
+            return None
+
+        # if user doesn't exist, nullify
+        user_id = row_dict.get("user_id")
+        if user_id is not None and user_id not in refs["user_id"]:
+            notes["user nullified, user missing"] += 1
+            row_dict["user_id"] = None
+
+    if table == "users":
+        # Map the fields
+        created_at = clean_date(row_dict.pop("created_at", None))
+
+        # If date_joined is not None, make it timezone-aware
+        if created_at is not None:
+            row_dict["date_joined"] = created_at
+
+        row_dict["is_staff"] = row_dict.pop("admin", None) == 1
+        row_dict["is_superuser"] = row_dict["is_staff"]
+        row_dict["first_name"] = row_dict.pop("login", None)
+
+        row_dict["username"] = dedupe_username(row_dict.pop("permalink", None))
+
+        # Remove unnecessary fields
+        unnecessary_fields = [
+            "crypted_password",
+            "salt",
+            "updated_at",
+            "remember_token",
+            "remember_token_expires_at",
+        ]
+        for field in unnecessary_fields:
+            row_dict.pop(field, None)
+
+    if table == "reviews":
+        # Remove unnecessary fields
+        unnecessary_fields = [
+            "item_id",
+            "relevancy",
+        ]
+        for field in unnecessary_fields:
+            row_dict.pop(field, None)
+
+        # Adjust review rating if it's outside the desired range
+        rating = row_dict.get("rating")
+        if rating is not None:
+            row_dict["rating"] = max(1, min(5, rating))
+
+        # if version doesn't exist, skip the row
+        version_id = row_dict.get("version_id")
+        if version_id is None or version_id not in refs["version_id"]:
+            notes["skipped, version missing"] += 1
+            return None
+
+    if table == "screenshots":
+        if "title" in row_dict and row_dict["title"] is None:
+            row_dict["title"] = ""
+
+        # if item doesn't exist, skip the row
+        item_id = row_dict.get("item_id")
+        if item_id is None or item_id not in refs["item_id"]:
+            notes["skipped, item missing"] += 1
+            return None
+
+    if "file" in row_dict and row_dict["file"] is not None:
+        filename = row_dict["file"]
+        row_dict["file"] = f"{table}/{row_dict['id']}/{filename}"
+
+    if "updated_at" in row_dict:
+        row_dict["updated_at"] = clean_date(row_dict["updated_at"])
+
+    if "created_at" in row_dict:
+        row_dict["created_at"] = clean_date(row_dict["created_at"])
+
+    if "created_at" in row_dict and row_dict["created_at"] is None:
+        row_dict["created_at"] = row_dict["updated_at"]
+
+    if "updated_at" in row_dict and row_dict["updated_at"] is None:
+        row_dict["updated_at"] = row_dict["created_at"]
+
+    if (
+        "created_at" in row_dict
+        and row_dict["created_at"] is None
+        and "updated_at" in row_dict
+        and row_dict["updated_at"] is None
+    ):
+        # get item created_at
+        item_id = row_dict.get("item_id")
+        if item_id is not None and item_id in refs["item_created_at"]:
+            row_dict["created_at"] = refs["item_created_at"][item_id]
+            row_dict["updated_at"] = refs["item_created_at"][item_id]
+        else:
+            # Downloads is full of junk data, so we don't care about it
+            notes["skipped, no created_at or updated_at"] += 1
+            return None
+
+    if "created_at" in row_dict:
+        created_at = clean_date(row_dict["created_at"])
+        updated_at = clean_date(row_dict.get("updated_at"))
+
+        if created_at is not None and created_at > timezone.now():
+            row_dict["created_at"] = updated_at
+
+    if "body" in row_dict and row_dict["body"] is not None:
+        row_dict["body"] = correct_encoding(
+            row_dict["body"]
+            .replace("\\r\\n", "\\r")
+            .replace("\\r", "\r")
+            .replace("\\n", "\n")
+        )
+
+    return {
+        k: v
+        for k, v in row_dict.items()
+        if not (k.endswith("_count") or k.endswith("_created_at"))
+    }
+
+
+def copy_value(value):
+    if value is None:
+        return "\\N"
+
+    if isinstance(value, bool):
+        return "t" if value else "f"
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_batch(Model, instances):
+    # PostgreSQL COPY in text format is far cheaper than INSERT for bulk loads
+    fields = Model._meta.concrete_fields
+    if instances[0].pk is None:
+        # Rows without an id, like item-tag pairs, take one from the sequence
+        fields = [field for field in fields if not field.primary_key]
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+
+    buffer = io.StringIO()
+    for instance in instances:
+        buffer.write(
+            "\t".join(
+                copy_value(
+                    field.get_db_prep_save(
+                        field.value_from_object(instance), connection
+                    )
+                )
+                for field in fields
+            )
+        )
+        buffer.write("\n")
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {connection.ops.quote_name(Model._meta.db_table)} ({columns}) FROM STDIN",
+            buffer,
+        )
+
+
+def save_batch(Model, instances):
+    if connection.vendor == "postgresql":
+        copy_batch(Model, instances)
+    else:
+        Model.objects.bulk_create(instances, batch_size=BATCH_SIZE)
+
+
+def import_table(table, Model):
+    notes.clear()
+    conn = sqlite3.connect(LEGACY_DATABASE)
+
+    after_id = last_imported_id(table)
+    if after_id:
+        print(f"Resuming {table} table after id {after_id}...")
+
+    if table == "users" and after_id:
+        # Usernames already imported still count towards later duplicates
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT permalink FROM users WHERE id <= ? ORDER BY id", [after_id]
+        )
+        for (username,) in cursor:
+            dedupe_username(username)
+
+    saved = 0
+    for count in save_rows(table, Model, read_rows(conn, table, after_id)):
+        saved += count
+        print(f"Saved {saved} rows to {table} table...")
+
+    for note, count in notes.items():
+        print(f"{table}: {count} rows {note}")
+
+    conn.close()
+
+
+def transform_rows(table, row_dicts):
+    refs = load_references(table, row_dicts)
+    rows = (transform_row(table, row_dict, refs) for row_dict in row_dicts)
+    return [row_dict for row_dict in rows if row_dict is not None]
+
+
+def save_rows(table, Model, row_dicts):
+    """Transforms legacy rows and saves them in batches, yielding each batch's size."""
+    for batch in batched(row_dicts, BATCH_SIZE):
+        yield from save_transformed(Model, transform_rows(table, batch))
+
+
+def save_transformed(Model, rows):
+    with suppress_auto_now(Model, ["created_at", "updated_at"]):
+        for batch in batched((Model(**row_dict) for row_dict in rows), BATCH_SIZE):
+            save_batch(Model, batch)
+            yield len(batch)
+
+
+def import_table_in_worker(table):
+    import_table(table, dict(tables)[table])
+
+
+def import_group(group, workers):
+    if workers > 1 and len(group) > 1:
+        # Forked workers must not share this process's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(group)),
+            mp_context=multiprocessing.get_context("fork"),
+        ) as executor:
+            futures = [
+                executor.submit(import_table_in_worker, table) for table in group
             ]
-            for field in unnecessary_fields:
-                row_dict.pop(field, None)
+            for future in futures:
+                future.result()
+    else:
+        for table in group:
+            import_table(table, dict(tables)[table])
 
-            # Adjust review rating if it's outside the desired range
-            rating = row_dict.get("rating")
-            if rating is not None:
-                row_dict["rating"] = max(1, min(5, rating))
 
-            # if version doesn't exist, skip the row
-            version_id = row_dict.get("version_id")
-            if version_id is None or version_id not in version_ids:
+def index_dump(path):
+    """
+    Reads the dump once and returns the columns of each table and the
+    (table, offset, length) of each INSERT, so each group can seek straight
+    to its own statements. mysqldump writes every INSERT on a single line,
+    so statements are split without parsing their values; that is left to
+    the workers.
+    """
+    columns = {}
+    inserts = []
+    with open(path, "rb") as f:
+        offset = 0
+        start = 0
+        lines = []
+        for raw_line in f:
+            line = raw_line.decode()
+            line_start = offset
+            offset += len(raw_line)
+
+            if not lines and SKIPPED_LINE.match(line):
                 continue
 
-        if table == "screenshots":
-            if "title" in row_dict and row_dict["title"] is None:
-                row_dict["title"] = ""
-
-            # if item doesn't exist, skip the row
-            item_id = row_dict.get("item_id")
-            if item_id is None or item_id not in item_ids:
-                print("SKIPPING ROW item_id", item_id, item_ids)
-                print(row_dict)
+            if not lines:
+                start = line_start
+            lines.append(line)
+            if not STATEMENT_END.search(line):
                 continue
 
-        if "file" in row_dict and row_dict["file"] is not None:
-            filename = row_dict["file"]
-            row_dict["file"] = f"{table}/{row_dict['id']}/{filename}"
-
-        if "updated_at" in row_dict:
-            row_dict["updated_at"] = clean_date(row_dict["updated_at"])
-
-        if "created_at" in row_dict:
-            row_dict["created_at"] = clean_date(row_dict["created_at"])
-
-        if "created_at" in row_dict and row_dict["created_at"] is None:
-            row_dict["created_at"] = row_dict["updated_at"]
-
-        if "updated_at" in row_dict and row_dict["updated_at"] is None:
-            row_dict["updated_at"] = row_dict["created_at"]
-
-        if (
-            "created_at" in row_dict
-            and row_dict["created_at"] is None
-            and "updated_at" in row_dict
-            and row_dict["updated_at"] is None
-        ):
-            # get item created_at
-            item_id = row_dict.get("item_id")
-            if item_id is not None and item_id in item_created_at:
-                row_dict["created_at"] = item_created_at[item_id]
-                row_dict["updated_at"] = item_created_at[item_id]
-            else:
-                # Downloads is full of junk data, so we don't care about it
-                if table != "downloads":
-                    print("Skipping record with no created_at or updated_at:")
-                    print(row_dict)
+            statement = "".join(lines)
+            lines = []
+
+            if m := CREATE_TABLE.match(statement):
+                columns[m[1]] = COLUMN.findall(statement)
+            elif m := INSERT_HEADER.match(statement):
+                inserts.append((m[1], start, offset - start))
+
+    return columns, inserts
+
+
+def read_dump(path, index, group):
+    """Yields (table, columns, statement) for each INSERT into a table in group."""
+    columns, inserts = index
+    with open(path, "rb") as f:
+        for table, offset, length in inserts:
+            if table in group:
+                f.seek(offset)
+                yield table, columns[table], f.read(length).decode()
+
+
+def transform_dump_statement(table, columns, statement, after_id):
+    """
+    Parses and transforms the rows of one INSERT, returning the rows to save
+    and the notes about them.
+    """
+    notes.clear()
+
+    header = INSERT_HEADER.match(statement)
+    row_dicts = (
+        dict(zip(columns, parse_row(m[0])))
+        for m in ROW.finditer(statement, header.end())
+    )
+
+    new_row_dicts = []
+    for row_dict in row_dicts:
+        if row_dict["id"] <= after_id:
+            if table == "users":
+                # Usernames already imported still count towards later duplicates
+                dedupe_username(row_dict["permalink"])
+            continue
+        new_row_dicts.append(row_dict)
+
+    return transform_rows(table, new_row_dicts), notes.copy()
+
+
+def import_group_from_dump(path, index, group, workers):
+    after_ids = {}
+    for table in group:
+        after_ids[table] = last_imported_id(table)
+        if after_ids[table]:
+            print(f"Resuming {table} table after id {after_ids[table]}...")
+
+    saved = Counter()
+    group_notes = {table: Counter() for table in group}
+
+    def save(table, result):
+        rows, statement_notes = result
+        group_notes[table].update(statement_notes)
+
+        if not rows:
+            return
+        Model = dict(tables)[table]
+
+        saved[table] += sum(save_transformed(Model, rows))
+        print(f"Saved {saved[table]} rows to {table} table...")
+
+    # Username dedup depends on state kept in this process, and taggings on
+    # the pairs saved before them, so both are transformed here, in order.
+    in_process = {"users", "taggings"}
+
+    # Workers only parse and transform; rows are saved here, in dump order, so
+    # an interrupted import has committed a prefix of each table and resuming
+    # after its highest id skips nothing. Forked workers must not share this
+    # process's database connections.
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork")
+    ) as executor:
+        pending = deque()
+        for table, columns, statement in read_dump(path, index, group):
+            args = (table, columns, statement, after_ids[table])
+            if workers <= 1 or table in in_process:
+                save(table, transform_dump_statement(*args))
                 continue
 
-        if "created_at" in row_dict:
-            created_at = clean_date(row_dict["created_at"])
-            updated_at = clean_date(row_dict.get("updated_at"))
+            pending.append((table, executor.submit(transform_dump_statement, *args)))
 
-            if created_at is not None and created_at > timezone.now():
-                row_dict["created_at"] = updated_at
+            # Keep only a few statements in memory while the workers catch up
+            while len(pending) > workers * 2:
+                table, future = pending.popleft()
+                save(table, future.result())
 
-        if "body" in row_dict and row_dict["body"] is not None:
-            row_dict["body"] = correct_encoding(
-                row_dict["body"]
-                .replace("\\r\\n", "\\r")
-                .replace("\\r", "\r")
-                .replace("\\n", "\n")
-            )
+        while pending:
+            table, future = pending.popleft()
+            save(table, future.result())
+
+    for table in group:
+        for note, count in group_notes[table].items():
+            print(f"{table}: {count} rows {note}")
 
-        row_dict = {
-            k: v
-            for k, v in row_dict.items()
-            if not (k.endswith("_count") or k.endswith("_created_at"))
-        }
-        print(row_dict)
 
-        instance = Model(**row_dict)
+def clear_tables():
+    if connection.vendor == "postgresql":
+        db_tables = [Model._meta.db_table for _, Model in tables]
+        print(f"Truncating {', '.join(db_tables)}...")
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {', '.join(db_tables)} CASCADE")
+        return
 
-        instances.append(instance)
+    for table, Model in tables[::-1]:
+        if table == "items":
+            Model.objects.update(tc=None)
 
-        if len(instances) > 99999:
-            with suppress_auto_now(Model, ["created_at", "updated_at"]):
-                print(f"Saving {len(instances)} rows to {table} table...")
-                Model.objects.bulk_create(instances)
+        print(f"Deleting all {table} rows...")
+        Model.objects.all().delete()
 
-            instances = []
 
-    # Bulk create instances
-    if Model is not None:
-        with suppress_auto_now(Model, ["created_at", "updated_at"]):
-            print(f"Saving {len(instances)} rows to {table} table...")
-            Model.objects.bulk_create(instances)
+def find_constraints_and_indexes():
+    """
+    Finds foreign keys, unique constraints and secondary indexes on the
+    imported tables, so the load does not have to maintain them row by row.
+    Returns (name, recreate statement, drop statement) triples, in the order
+    they can be recreated.
+    """
+    db_tables = [Model._meta.db_table for _, Model in tables]
 
-    if table == "items":
-        item_ids = set(Item.objects.values_list("id", flat=True))
-        item_created_at = dict(
-            Item.objects.values_list("id", "created_at").distinct().all()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT indexname, indexdef
+            FROM pg_indexes
+            WHERE tablename = ANY(%s)
+            AND indexname NOT IN (SELECT conname FROM pg_constraint)
+            """,
+            [db_tables],
         )
+        deferred = [
+            (name, definition, f'DROP INDEX IF EXISTS "{name}"')
+            for name, definition in cursor.fetchall()
+        ]
 
-    if table == "versions":
-        version_ids = set(Version.objects.values_list("id", flat=True))
+        # Unique constraints before the foreign keys that may rely on them
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid::regclass::text = ANY(%s) AND contype IN ('f', 'u')
+            ORDER BY contype DESC
+            """,
+            [db_tables],
+        )
+        deferred += [
+            (
+                name,
+                f'ALTER TABLE {db_table} ADD CONSTRAINT "{name}" {definition}',
+                f'ALTER TABLE {db_table} DROP CONSTRAINT IF EXISTS "{name}"',
+            )
+            for db_table, name, definition in cursor.fetchall()
+        ]
 
-    if table == "users":
-        user_ids = set(User.objects.values_list("id", flat=True))
+    return deferred
 
-with suppress_auto_now(Item, ["created_at", "updated_at"]):
-    tag_instances = []
-    for item_id, tag_ids in taggings_dict.items():
-        if item_id not in item_ids:
-            print(f"Could not find item_id {item_id} in item_ids")
-            continue
 
-        item = Item.objects.get(id=item_id)
-        tags = Tag.objects.filter(id__in=tag_ids)
-        item.tags.set(tags)
+def drop_constraints_and_indexes(deferred):
+    with connection.cursor() as cursor:
+        for _, _, statement in reversed(deferred):
+            cursor.execute(statement)
+
 
-    # Bulk create items
-    print(f"Saving {len(tag_instances)} tags to tags table...")
-    Tag.objects.bulk_create(tag_instances)
+def recreate_constraints_and_indexes(deferred):
+    with connection.cursor() as cursor:
+        for name, statement, _ in deferred:
+            # Skip anything a previous, interrupted attempt already restored
+            cursor.execute(
+                """
+                SELECT 1 FROM pg_indexes WHERE indexname = %s
+                UNION SELECT 1 FROM pg_constraint WHERE conname = %s
+                """,
+                [name, name],
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(statement)
 
 
-for table, Model in tables:
-    if Model:
+def main():
+    parser = argparse.ArgumentParser(description="Import the legacy database")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Processes used to load independent tables at the same time",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted import from the last committed batch of each table",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Import only rows newer than those already imported, e.g. from a newer dump, "
+        "keeping existing rows, constraints and indexes",
+    )
+    parser.add_argument(
+        "--mysql-dump",
+        metavar="PATH",
+        help="Read the legacy data straight from a mysqldump file instead of the "
+        "converted SQLite database",
+    )
+    args = parser.parse_args()
+
+    if not (args.resume or args.incremental):
+        clear_tables()
+
+    deferred = []
+    if os.path.exists(DEFERRED_CONSTRAINTS_FILE):
+        with open(DEFERRED_CONSTRAINTS_FILE) as f:
+            deferred = json.load(f)
+    elif connection.vendor == "postgresql" and not args.incremental:
+        # Saved before anything is dropped, so a crash part way through the
+        # drops cannot lose a definition
+        deferred = find_constraints_and_indexes()
+        with open(DEFERRED_CONSTRAINTS_FILE, "w") as f:
+            json.dump(deferred, f)
+
+    if deferred:
+        # Also finishes the drops of an interrupted import
+        print("Dropping constraints and indexes until the import is done...")
+        drop_constraints_and_indexes(deferred)
+
+    if args.mysql_dump:
+        print("Indexing the dump...")
+        dump_index = index_dump(args.mysql_dump)
+
+    for group in table_groups:
+        if args.mysql_dump:
+            import_group_from_dump(args.mysql_dump, dump_index, group, args.workers)
+        else:
+            import_group(group, args.workers)
+
+    recount_tags(Tag.objects.values("pk"))
+
+    if deferred:
+        print("Recreating constraints and indexes...")
+        recreate_constraints_and_indexes(deferred)
+        os.remove(DEFERRED_CONSTRAINTS_FILE)
+
+    for table, Model in tables:
         synchronize_last_sequence(Model)
 
-# Close the SQLite database connection
-conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,97 @@
+import json
+import logging
+import random
 import re
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
 from django.http import HttpResponsePermanentRedirect
 from urllib.parse import urlencode
 from django.shortcuts import redirect
-from django.urls import resolve
+
+from items.utils import ORDER_VALUES
+from s7.timing import Timings, current_timings, instrument_cache, instrument_templates
+
+logger = logging.getLogger("s7.timing")
+
+
+class ServerTimingMiddleware:
+    """
+    Records database queries, template rendering and cache hits for each
+    request. Staff get them in a Server-Timing header, and a sample of
+    requests, plus every slow one, is logged as a line of JSON.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_templates()
+
+    def __call__(self, request):
+        for alias in settings.CACHES:
+            instrument_cache(caches[alias])
+
+        timings = Timings()
+        with self.timed(timings):
+            response = self.get_response(request)
+
+        if response.streaming:
+            # Headers are sent before the body is read, so the work done while
+            # streaming can only be logged
+            response.streaming_content = self.timed_stream(
+                response.streaming_content, timings, request, response
+            )
+            return response
+
+        if timings.show_header:
+            response["Server-Timing"] = timings.header()
+        self.log(request, response, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Read while timing, so loading the session and user is counted too.
+        # Without a session cookie nobody is signed in, let alone staff.
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            current_timings.get().show_header = request.user.is_staff
+
+    @contextmanager
+    def timed(self, timings):
+        token = current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                yield
+        finally:
+            current_timings.reset(token)
+
+    def timed_stream(self, content, timings, request, response):
+        try:
+            with self.timed(timings):
+                yield from content
+        finally:
+            self.log(request, response, timings)
+
+    def log(self, request, response, timings):
+        if (
+            random.random() >= settings.SERVER_TIMING_SAMPLE_RATE
+            and timings.total_time * 1000 < settings.SERVER_TIMING_SLOW_MS
+        ):
+            return
+
+        match = request.resolver_match
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "view": match.view_name if match else None,
+                    "status": response.status_code,
+                    **timings.as_dict(),
+                }
+            )
+        )
 
 
 class RemoveWwwAndHttpsRedirectMiddleware:
@@ -35,7 +124,7 @@ class ValidateAndCleanUrlsMiddleware:
         "reviews": ["page"],
     }
 
-    ORDER_VALUES = ["old", "reviews", "best", "worst", "loud", "popular", "random"]
+    ORDER_VALUES = ORDER_VALUES
 
     BAD_URL_REGEX = re.compile(r"{.*")
 
@@ -48,10 +137,11 @@ class ValidateAndCleanUrlsMiddleware:
         if request.path_info != clean_path:
             return redirect(clean_path)
 
-        try:
-            view_name = resolve(clean_path).view_name
-        except:
-            view_name = None
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # By now Django has resolved the path and set request.resolver_match
+        view_name = request.resolver_match.view_name
 
         if view_name in self.VALID_QUERY_PARAMS:
             params = request.GET.copy()
@@ -66,11 +156,10 @@ class ValidateAndCleanUrlsMiddleware:
                     params.pop(param)
 
             if request.GET != params:
-                url = f"{clean_path}?{urlencode(params, doseq=True)}"
+                url = f"{request.path_info}?{urlencode(params, doseq=True)}"
                 return redirect(url)
 
-        response = self.get_response(request)
-        return response
+        return None
 
     def _is_valid_param(self, view_name, param, values):
         if param not in self.VALID_QUERY_PARAMS[view_name]:
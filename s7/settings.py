@@ -63,6 +63,7 @@ MIDDLEWARE = (
     ]
     + (["whitenoise.middleware.WhiteNoiseMiddleware"] if not DEBUG else [])
     + [
+        "s7.middleware.ServerTimingMiddleware",
         "s7.middleware.RemoveWwwAndHttpsRedirectMiddleware",
         "s7.middleware.ValidateAndCleanUrlsMiddleware",
         "django.contrib.sessions.middleware.SessionMiddleware",
@@ -287,6 +288,52 @@ else:
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Without REDIS_URL each process caches on its own, which is only fine for a
+# single process in development: throttle buckets and invalidated feeds and
+# form choices have to be shared by every worker and dyno.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            # Heroku Redis serves TLS with a self-signed certificate
+            "OPTIONS": (
+                {"ssl_cert_reqs": None}
+                if os.environ["REDIS_URL"].startswith("rediss://")
+                else {}
+            ),
+        }
+    }
+
+REST_FRAMEWORK = {
+    "DEFAULT_PAGINATION_CLASS": "items.pagination.ListPagination",
+    "PAGE_SIZE": int(os.environ.get("API_PAGE_SIZE", 50)),
+    # The Heroku router appends the client address to X-Forwarded-For, so only
+    # the last entry can be trusted when throttling by IP
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 1)),
+    "DEFAULT_THROTTLE_CLASSES": [
+        "items.throttles.AnonBucketThrottle",
+        "items.throttles.UserBucketThrottle",
+    ],
+    # Token buckets as "<tokens>/<period>", refilled over the period; set a
+    # scope's variable to "none" to turn its throttle off
+    "DEFAULT_THROTTLE_RATES": {
+        scope: None if rate.lower() == "none" else rate
+        for scope, rate in {
+            "anon": os.environ.get("THROTTLE_ANON", "120/min"),
+            "user": os.environ.get("THROTTLE_USER", "300/min"),
+            "download": os.environ.get("THROTTLE_DOWNLOAD", "30/min"),
+            "export": os.environ.get("THROTTLE_EXPORT", "10/hour"),
+        }.items()
+    },
+}
+
+# Upper bound on ?page_size= for API list endpoints
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 500))
+
+# Upper bound on the keys one /api/items/batch/ request can ask for
+API_MAX_BATCH_SIZE = int(os.environ.get("API_MAX_BATCH_SIZE", 200))
+
 # Markdownify
 
 MARKDOWNIFY = {
@@ -324,16 +371,31 @@ LOGGING = {
             "level": "DEBUG",
             "filters": ["require_debug_true"],
             "class": "logging.StreamHandler",
-        }
+        },
+        "timing": {
+            "level": "INFO",
+            "class": "logging.StreamHandler",
+        },
     },
     "loggers": {
         "django.db.backends": {
             "level": "DEBUG",
             "handlers": ["console"],
-        }
+        },
+        "s7.timing": {
+            "level": "INFO",
+            "handlers": ["timing"],
+            "propagate": False,
+        },
     },
 }
 
+# Share of requests ServerTimingMiddleware logs, besides every slow one
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.environ.get("SERVER_TIMING_SAMPLE_RATE", 1 if DEBUG else 0.01)
+)
+SERVER_TIMING_SLOW_MS = float(os.environ.get("SERVER_TIMING_SLOW_MS", 1000))
+
 USE_THOUSAND_SEPARATOR = True
 
 EMAIL_BACKEND = "django_ses.SESBackend"
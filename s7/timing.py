@@ -0,0 +1,130 @@
+import time
+from contextvars import ContextVar
+
+from django.template.base import Template
+
+# Timings of the request being handled on this thread, if any
+current_timings = ContextVar("current_timings", default=None)
+
+MISSING = object()
+
+
+class Timings:
+    """
+    Counts for one request. Doubles as a database execute wrapper, so it can
+    be installed with connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.show_header = False
+        # Set while inside an outer call whose nested calls shouldn't count
+        self.rendering = False
+        self.reading_cache = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        return ", ".join(
+            [
+                f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+                f"tpl;dur={self.template_time * 1000:.1f}",
+                f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+                f"total;dur={self.total_time * 1000:.1f}",
+            ]
+        )
+
+    def as_dict(self):
+        return {
+            "total_ms": round(self.total_time * 1000, 1),
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_time * 1000, 1),
+            "template_ms": round(self.template_time * 1000, 1),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+
+def instrument_templates():
+    """
+    Times Template._render, the same hook Django's test runner instruments.
+    Included and extended templates render inside the outermost one, so only
+    that one is timed.
+    """
+    render = Template._render
+    if getattr(render, "timed", False):
+        return
+
+    def timed_render(self, context):
+        timings = current_timings.get()
+        if timings is None or timings.rendering:
+            return render(self, context)
+
+        timings.rendering = True
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timings.rendering = False
+            timings.template_time += time.perf_counter() - started
+
+    timed_render.timed = True
+    Template._render = timed_render
+
+
+def instrument_cache(cache):
+    """
+    Counts hits and misses of get() and get_many() on a cache connection.
+    get_or_set() goes through get(). Connections are per thread, so this runs
+    once per thread and cache.
+    """
+    if getattr(cache, "timed", False):
+        return
+
+    get = cache.get
+    get_many = cache.get_many
+
+    def timed_get(key, default=None, version=None):
+        timings = current_timings.get()
+        value = get(key, MISSING, version=version)
+        if timings is not None and not timings.reading_cache:
+            if value is MISSING:
+                timings.cache_misses += 1
+            else:
+                timings.cache_hits += 1
+        return default if value is MISSING else value
+
+    def timed_get_many(keys, version=None):
+        timings = current_timings.get()
+        if timings is None or timings.reading_cache:
+            return get_many(keys, version=version)
+
+        keys = list(keys)
+        # Some backends implement get_many() with get()
+        timings.reading_cache = True
+        try:
+            values = get_many(keys, version=version)
+        finally:
+            timings.reading_cache = False
+        timings.cache_hits += len(values)
+        timings.cache_misses += len(keys) - len(values)
+        return values
+
+    cache.get = timed_get
+    cache.get_many = timed_get_many
+    cache.timed = True